@@ -2,7 +2,9 @@ from enum import StrEnum
 from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorDeviceClass
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
 from homeassistant.components.number import NumberEntity, NumberDeviceClass, NumberMode
-from .chuguan.RealDevice import realDevice
+from .chuguan.RealDevice import realDevice, real_device_signal
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.event import async_track_time_interval
 from datetime import timedelta
 from homeassistant.components.button import ButtonEntity
@@ -12,10 +14,22 @@ import datetime
 from homeassistant.components.update import UpdateEntity, UpdateDeviceClass, UpdateEntityFeature, _version_is_newer
 from .chuguan.hub import getAlreadyExistHub
 from .chuguan.utils import download_file_to_tmp
+from .chuguan.const import RADAR_STATS_ATTRIBUTE_WINDOW, RADAR_STATS_BIN_CM
 from homeassistant.exceptions import HomeAssistantError
 
 _LOGGER = logging.getLogger(__name__)
 
+# 统计属性每次都会变化, 不写入 recorder
+STATS_ATTRIBUTES = frozenset({
+    "stats_window_seconds",
+    "covered_seconds",
+    "occupancy_ratio",
+    "motion_triggers",
+    "trigger_rate_per_minute",
+    "histogram_bin_cm",
+    "distance_histogram",
+})
+
 
 class KeyType(StrEnum):
     MOTION = 'motion'
@@ -41,10 +55,21 @@ class MotionBinarySensor(BinarySensorEntity):
         self._is_on = False
         self._attr_device_info = realDevice.motionDevice
 
+    _unrecorded_attributes = STATS_ATTRIBUTES
+
     @property
     def is_on(self) -> bool:
         """Return true if the binary sensor is on."""
         return self._is_on
+
+    @property
+    def extra_state_attributes(self):
+        summary = realDevice.stats_summary()
+        return {
+            "stats_window_seconds": RADAR_STATS_ATTRIBUTE_WINDOW,
+            "motion_triggers": summary["motion_triggers"],
+            "trigger_rate_per_minute": summary["trigger_rate_per_minute"],
+        }
     
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
@@ -54,16 +79,16 @@ class MotionBinarySensor(BinarySensorEntity):
         #     async_track_time_interval(self.hass, self.update_is_on, timedelta(seconds=1))
         # )
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_is_on)
+            async_dispatcher_connect(self.hass, real_device_signal('motion_on'), self.update_is_on)
         )
     
-    async def update_is_on(self, now):
+    @callback
+    def update_is_on(self, value: bool):
         """Update the binary sensor state."""
-        oldValue = self._is_on
-        self._is_on = await realDevice.getKV('motion_on') == '1'
-        if oldValue == self._is_on:
+        if value == self._is_on:
             return
-        self.schedule_update_ha_state()
+        self._is_on = value
+        self.async_write_ha_state()
 
 class PresenceBinarySensor(BinarySensorEntity):
     """"""
@@ -76,9 +101,20 @@ class PresenceBinarySensor(BinarySensorEntity):
         self._is_on = False
         self._attr_device_info = realDevice.presenceDevice
 
+    _unrecorded_attributes = STATS_ATTRIBUTES
+
     @property
     def is_on(self) -> bool:
         return self._is_on
+
+    @property
+    def extra_state_attributes(self):
+        summary = realDevice.stats_summary()
+        return {
+            "stats_window_seconds": RADAR_STATS_ATTRIBUTE_WINDOW,
+            "covered_seconds": summary["covered_seconds"],
+            "occupancy_ratio": summary["occupancy_ratio"],
+        }
     
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
@@ -88,21 +124,22 @@ class PresenceBinarySensor(BinarySensorEntity):
         #     async_track_time_interval(self.hass, self.update_is_on, timedelta(seconds=1))
         # )
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_is_on)
+            async_dispatcher_connect(self.hass, real_device_signal('presence_on'), self.update_is_on)
         )
     
-    async def update_is_on(self, now):
-        oldValue = self._is_on
-        self._is_on = await realDevice.getKV('presence_on') == '1'
-        if oldValue == self._is_on:
+    @callback
+    def update_is_on(self, value: bool):
+        if value == self._is_on:
             return
-        self.schedule_update_ha_state()
+        self._is_on = value
+        self.async_write_ha_state()
 
 class DistanceSensor(SensorEntity):
     """距离传感器（支持运动和存在距离）"""
     _attr_device_class = SensorDeviceClass.DISTANCE
     _attr_native_unit_of_measurement = "cm"
     _attr_state_class = SensorStateClass.MEASUREMENT
+    _unrecorded_attributes = STATS_ATTRIBUTES
 
     def __init__(self, name: str, distance_type: KeyType):
         self._distance_type = distance_type  # 'motion' 或 'presence'
@@ -117,29 +154,33 @@ class DistanceSensor(SensorEntity):
     @property
     def native_value(self):
         return self._distance
+
+    @property
+    def extra_state_attributes(self):
+        summary = realDevice.stats_summary()
+        return {
+            "stats_window_seconds": RADAR_STATS_ATTRIBUTE_WINDOW,
+            "histogram_bin_cm": RADAR_STATS_BIN_CM,
+            "distance_histogram": summary[f"{self._distance_type}_histogram"],
+        }
     
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
-        await self.update_Distance(None)
+        self._distance = await realDevice.getKV(f'{self._distance_type}_distance')
+        self.async_write_ha_state()
         # self.async_on_remove(
         #     async_track_time_interval(self.hass, self.update_Distance, timedelta(seconds=1))
         # )
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_Distance)
+            async_dispatcher_connect(self.hass, real_device_signal(f'{self._distance_type}_distance'), self.update_Distance)
         )
     
-    async def update_Distance(self, now):
-        newValue = 0
-        if self._distance_type == KeyType.MOTION:
-            newValue = await realDevice.getKV('motion_distance')
-        elif self._distance_type == KeyType.PRESENCE:
-            newValue = await realDevice.getKV('presence_distance')
-        if newValue == '':
-            return
-        if newValue == self._distance:
+    @callback
+    def update_Distance(self, value: int | None):
+        if value == self._distance:
             return
-        self._distance = newValue
-        self.schedule_update_ha_state()
+        self._distance = value
+        self.async_write_ha_state()
     
 
 class SettingNumber(NumberEntity):
@@ -266,13 +307,13 @@ class EnvironmentStudySensor(BinarySensorEntity):
         #     async_track_time_interval(self.hass, self.update_value, timedelta(seconds=1))
         # )
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_value)
+            async_dispatcher_connect(self.hass, real_device_signal('environment_study'), self.update_value)
         )
 
-    async def update_value(self, now=None):
-        self._is_on = await realDevice.getKV('environment_study') == '1'
-        if self.hass:
-            self.schedule_update_ha_state()
+    @callback
+    def update_value(self, value: str):
+        self._is_on = value == '1'
+        self.async_write_ha_state()
 
 class HardwareMonitorButton(ButtonEntity):
     """硬件监控按钮"""
@@ -299,22 +340,31 @@ class HardwareMonitorSensor(BinarySensorEntity):
     @property
     def is_on(self):
         return self._is_on
+
+    @property
+    def extra_state_attributes(self):
+        """守护的重启次数、卡住次数和中断时长"""
+        return realDevice.supervisor.attributes()
     
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
-        self._is_on = realDevice.is_monitor
+        self._is_on = realDevice.is_monitor and not realDevice.supervisor.stalled
         self.schedule_update_ha_state()
         # self.async_on_remove(
         #     async_track_time_interval(self.hass, self.update_value, timedelta(seconds=1))
         # )
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_value)
+            async_dispatcher_connect(self.hass, real_device_signal('is_monitor'), self.update_value)
+        )
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, real_device_signal('monitor_stalled'), self.update_value)
         )
 
-    async def update_value(self, now=None):
-        self._is_on = realDevice.is_monitor
-        if self.hass:
-            self.schedule_update_ha_state()
+    @callback
+    def update_value(self, value: bool):
+        # 监控进程在运行但卡住时也视为未运行
+        self._is_on = realDevice.is_monitor and not realDevice.supervisor.stalled
+        self.async_write_ha_state()
 
 class CheckUpdateButton(ButtonEntity):
     """检查更新按钮"""
@@ -2,11 +2,13 @@ from homeassistant.components.light import LightEntity, ColorMode, ATTR_BRIGHTNE
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers import entity_registry as er
 from homeassistant.util.color import value_to_brightness, brightness_to_value
+import asyncio
 import logging
 import math
-from .chuguan.const import DOMAIN
+from .chuguan.const import DOMAIN, RELAY_CONFIRM_TIMEOUT
 from homeassistant.core import callback
-from .chuguan.RealDevice import realDevice
+from .chuguan.RealDevice import realDevice, real_device_signal
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.event import async_track_time_interval
 from datetime import timedelta
 from homeassistant.const import EntityCategory
@@ -29,24 +31,69 @@ class WayLight(LightEntity):
         self._attr_supported_color_modes = {ColorMode.ONOFF}
         self._attr_color_mode = ColorMode.ONOFF
         self._cancelable = None
+        self._target: bool | None = None
+        self._confirm: asyncio.Future | None = None
+        self._confirm_task: asyncio.Task | None = None
 
     @property
     def is_on(self) -> bool:
         return self._is_on
     
     async def async_turn_on(self, **kwargs):
-        await realDevice.setWayOn(self._way, True)
-        self._is_on = await realDevice.getWayOn(self._way)
-        self.schedule_update_ha_state()
+        await self.set_way_on(True)
 
     async def async_turn_off(self, **kwargs):
-        await realDevice.setWayOn(self._way, False)
-        self._is_on = await realDevice.getWayOn(self._way)
-        self.schedule_update_ha_state()
+        await self.set_way_on(False)
+
+    async def set_way_on(self, value: bool):
+        """切换继电器
+
+        乐观模式下写入目标状态后立即返回, 命令和确认在后台任务中进行, 超时未确认时恢复为实际状态并记录错误。
+        """
+        if not realDevice.relay_optimistic:
+            await realDevice.setWayOn(self._way, value)
+            self._is_on = await realDevice.getWayOn(self._way)
+            self.async_write_ha_state()
+            return
+        if self._confirm is not None and not self._confirm.done():
+            # 之前的切换被新的目标取代
+            self._confirm.set_result(False)
+        confirm = self._confirm = asyncio.get_running_loop().create_future()
+        self._target = value
+        self._is_on = value
+        self.async_write_ha_state()
+        self._confirm_task = self.hass.async_create_task(self._send_way_on(value, confirm))
+
+    async def _send_way_on(self, value: bool, confirm: asyncio.Future):
+        """发送命令并等待继电器上报, 超时只计算等待上报的时间"""
+        await realDevice.setWayOn(self._way, value)
+        try:
+            # 继电器原本就是目标状态时不会有变化上报
+            if self._confirm is confirm and await realDevice.getWayOn(self._way) != value:
+                async with asyncio.timeout(RELAY_CONFIRM_TIMEOUT):
+                    await confirm
+        except TimeoutError:
+            if self._confirm is confirm:
+                self._target = None
+                self._confirm = None
+                self._is_on = await realDevice.getWayOn(self._way)
+                self.async_write_ha_state()
+            _LOGGER.error(f"灯{self._way}切换失败: 继电器没有响应")
+            return
+        if self._confirm is confirm:
+            self._target = None
+            self._confirm = None
 
-    async def update_way(self, now):
-        self._is_on = await realDevice.getWayOn(self._way)
-        self.schedule_update_ha_state()
+    @callback
+    def update_way(self, value: bool):
+        if self._target is not None:
+            if value != self._target:
+                # 等待确认期间忽略旧状态
+                return
+            if self._confirm is not None and not self._confirm.done():
+                self._confirm.set_result(True)
+        self._is_on = value
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self) -> None:
         """Entity added to hass."""
@@ -55,7 +102,7 @@ class WayLight(LightEntity):
         self.async_write_ha_state()
         # self._cancelable = async_track_time_interval(self.hass, self.update_way, timedelta(seconds=1))
         self.async_on_remove(
-            self.hass.bus.async_listen('chuguan_xiaozhi_real_device_update_value', self.update_way)
+            async_dispatcher_connect(self.hass, real_device_signal(f'way_{self._way}'), self.update_way)
         )
 
     async def async_will_remove_from_hass(self):
@@ -63,6 +110,9 @@ class WayLight(LightEntity):
         if self._cancelable:
             self._cancelable()
             self._cancelable = None
+        if self._confirm_task is not None and not self._confirm_task.done():
+            self._confirm_task.cancel()
+        self._confirm_task = None
 
 WAY_BACKLIGHT_BRIGHTNESS_EVENT = "chuguan-xiaozhi.way_backlight_brightness"
 
@@ -55,6 +55,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: HubConfigEntry) -> bool:
     hub.entry = entry
     try:
         entry.runtime_data = hub
+        hub.apply_options(entry.options)
+        entry.async_on_unload(entry.add_update_listener(async_update_options))
         await hub.setup()
         await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
         return True
@@ -64,6 +66,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: HubConfigEntry) -> bool:
         raise ConfigEntryAuthFailed from e
 
 
+async def async_update_options(hass: HomeAssistant, entry: HubConfigEntry) -> None:
+    """Apply updated options."""
+    entry.runtime_data.apply_options(entry.options)
+
+
 # TODO Update entry annotation
 async def async_unload_entry(hass: HomeAssistant, entry: HubConfigEntry) -> bool:
     """Unload a config entry."""
@@ -1,10 +1,23 @@
 from .utils import async_execute_shell, fetch_data
 from homeassistant.helpers.device_registry import DeviceInfo
-from .const import DOMAIN
+from .const import DOMAIN, REAL_DEVICE_SIGNAL, RADAR_BACKEND_CLI, RADAR_BACKEND_SERIAL, RADAR_BACKEND_AUTO, DEFAULT_RADAR_BACKEND, DEFAULT_RADAR_SERIAL_PORT, DEFAULT_RADAR_SERIAL_BAUDRATE, DEFAULT_RELAY_OPTIMISTIC
+from .const import RADAR_STATS_ATTRIBUTE_WINDOW, DISTANCE_KINDS, DEFAULT_DISTANCE_DEADBAND, DEFAULT_DISTANCE_MIN_INTERVAL, DEFAULT_DISTANCE_WINDOW
 import logging
 import asyncio
-from homeassistant.core import HomeAssistant
+import shutil
+import time
+from functools import partial
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
 from .store import MyStore
+from .radar_parser import parse_radar_line
+from .radar_serial import SerialRadarLink, SerialCommandError
+from .radar_channel import RadarCommandChannel
+from .led_writer import LedWriter
+from .monitor_supervisor import MonitorSupervisor
+from .distance_filter import DistanceFilter
+from .radar_stats import RadarStats
 import re
 import json
 
@@ -13,6 +26,20 @@ _LOGGER = logging.getLogger(__name__)
 
 via_device=(DOMAIN, "ha_screen_device")
 
+KV_DEFAULTS = {
+    'motion_distance_min': '100',
+    'motion_distance_max': '300',
+    'motion_sensitivity': '8',
+    'presence_distance_min': '100',
+    'presence_distance_max': '300',
+    'presence_sensitivity': '8',
+    'presence_cycle': '2',
+}
+
+def real_device_signal(key: str) -> str:
+    """键对应的 dispatcher 信号"""
+    return REAL_DEVICE_SIGNAL.format(key)
+
 class RealDevice:
 
     device = DeviceInfo(manufacturer="初冠", model="小智", name="HA屏", identifiers={via_device}, model_id="cgxz")
@@ -42,26 +69,103 @@ class RealDevice:
         self._learn_task: asyncio.Task | None = None
         self.hass: HomeAssistant | None = None
         self.store: MyStore | None = None
+        # 滤波和统计使用的时钟, 回放时替换为录制时间
+        self.clock = time.monotonic
         self.target_name: str | None = None
+        self.backend = DEFAULT_RADAR_BACKEND
+        self.serial_port = DEFAULT_RADAR_SERIAL_PORT
+        self.serial_baudrate = DEFAULT_RADAR_SERIAL_BAUDRATE
+        self._link: SerialRadarLink | None = None
+        self.channel = RadarCommandChannel()
+        self.led_writer: LedWriter | None = None
+        self.relay_optimistic = DEFAULT_RELAY_OPTIMISTIC
+        self.supervisor = MonitorSupervisor(self._supervised_restart, self._on_supervisor_changed)
+        self.distance_filters = {
+            f'{kind}_distance': DistanceFilter(DEFAULT_DISTANCE_DEADBAND, DEFAULT_DISTANCE_MIN_INTERVAL, DEFAULT_DISTANCE_WINDOW)
+            for kind in DISTANCE_KINDS
+        }
+        self._distance_flush_cancels = {}
+        self.radar_stats = RadarStats()
+        self._stats_summary: tuple[float, dict] | None = None
+
+    def configure_backend(self, backend: str, serial_port: str, serial_baudrate: int) -> bool:
+        """设置与扩展板通信的方式, 返回是否有变化"""
+        if backend == RADAR_BACKEND_AUTO:
+            # 找不到 radar_key 且设置了串口时仍然使用串口
+            resolved = RADAR_BACKEND_SERIAL if serial_port and shutil.which(RADAR_BACKEND_CLI) is None else RADAR_BACKEND_CLI
+            _LOGGER.warning(f"Radar backend 'auto' is no longer supported, using {resolved}")
+            backend = resolved
+        config = (backend, serial_port, int(serial_baudrate))
+        if config == (self.backend, self.serial_port, self.serial_baudrate):
+            return False
+        self.backend, self.serial_port, self.serial_baudrate = config
+        if self.backend == RADAR_BACKEND_SERIAL and not self.serial_port:
+            _LOGGER.warning("Radar serial backend selected without radar_serial_port, using radar_key")
+        return True
+
+    def use_serial(self) -> bool:
+        """是否使用串口直连, 只有明确选择串口并设置了串口路径时才使用"""
+        return self.backend == RADAR_BACKEND_SERIAL and bool(self.serial_port)
+
+    async def _open_link(self) -> bool:
+        """打开串口, 失败时记录实际的错误"""
+        self._link = SerialRadarLink(self.serial_port, self.serial_baudrate, self._on_link_line)
+        try:
+            await self._link.open()
+            return True
+        except OSError as e:
+            _LOGGER.error(f"Cannot open radar serial port {self.serial_port}: {e}")
+            self._link = None
+            return False
 
+    async def _command(self, args: list[str]) -> str | None:
+        """执行一条 radar_key 命令, 串口直连时发给扩展板, 否则交给 radar_key 命令通道"""
+        if self._link is None:
+            return await self.channel.command(args)
+        try:
+            return await self._link.command(args)
+        except (SerialCommandError, ConnectionError, OSError, TimeoutError) as e:
+            _LOGGER.error(f"Radar serial command {' '.join(args)} failed: {e!r}")
+            return None
+
+    def _on_link_line(self, line: str):
+        """串口主动上报的行"""
+        self.supervisor.on_line()
+        self.hass.async_create_task(self.parse_line(line))
+
+    async def _supervised_restart(self):
+        """守护触发的重启"""
+        await self.start(self.hass)
+
+    def _on_supervisor_changed(self):
+        """卡住或恢复时通知监控实体"""
+        self.hass.async_create_task(self.update_value('monitor_stalled', self.supervisor.stalled))
 
     async def start(self, hass: HomeAssistant):
         """启动雷达监控子进程"""
         try:
             await self.stop()
+            self.hass = hass
+            self.supervisor.hass = hass
+            if self.led_writer is None:
+                self.led_writer = LedWriter(hass, self._command)
+            if self.use_serial() and not await self._open_link():
+                raise ConnectionError(f"radar serial port {self.serial_port} unavailable")
             self.target_name = await self.get_target_name()
             await self.resetKeySetting()
             await self.setLed()
-            status = await async_execute_shell(["radar_key", "--status", "--query-relay"])
+            status = await self._command(["--status", "--query-relay"])
             await self.parse_line(status)
-            self._process = await asyncio.create_subprocess_exec(
-                "stdbuf", "-oL", "radar_key", "--poll", "0",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            # 将读取任务作为后台任务运行
-            self.hass = hass
-            self._task = self.hass.async_create_background_task(self._read_loop(), "radar_key_monitor")
+            if self._link is not None:
+                self._task = self.hass.async_create_background_task(self._link_loop(), "radar_serial_monitor")
+            else:
+                self._process = await asyncio.create_subprocess_exec(
+                    "stdbuf", "-oL", "radar_key", "--poll", "0",
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                # 将读取任务作为后台任务运行
+                self._task = self.hass.async_create_background_task(self._read_loop(), "radar_key_monitor")
             _LOGGER.info("Radar monitor started successfully.")
             self.is_monitor = True
         except FileNotFoundError:
@@ -70,26 +174,48 @@ class RealDevice:
         except Exception as e:
             _LOGGER.error(f"Error starting radar monitor: {e}")
             self.is_monitor = False
+        if self.is_monitor:
+            self.supervisor.on_started()
+        else:
+            self.supervisor.on_down()
         await self.update_value('is_monitor', self.is_monitor)
 
     async def _read_loop(self):
         """持续读取并解析雷达输出"""
         assert self._process is not None and self._process.stdout is not None
-        
+        cancelled = False
         while not self._process.stdout.at_eof():
             try:
                 raw_line = await self._process.stdout.readline()
                 if not raw_line:
                     break
-                    
+                self.supervisor.on_line()
                 line = raw_line.decode('utf-8').strip()
                 await self.parse_line(line)
             except asyncio.CancelledError:
                 _LOGGER.info("Radar monitor task cancelled.")
+                cancelled = True
                 break
             except Exception as e:
                 _LOGGER.error(f"Error reading radar output: {e}")
         self.is_monitor = False
+        if not cancelled:
+            self.supervisor.on_down()
+        await self.update_value('is_monitor', self.is_monitor)
+
+    async def _link_loop(self):
+        """等待串口连接关闭"""
+        assert self._link is not None
+        cancelled = False
+        try:
+            exc = await self._link.wait_closed()
+            _LOGGER.warning(f"Radar serial closed: {exc!r}")
+        except asyncio.CancelledError:
+            _LOGGER.info("Radar serial monitor task cancelled.")
+            cancelled = True
+        self.is_monitor = False
+        if not cancelled:
+            self.supervisor.on_down()
         await self.update_value('is_monitor', self.is_monitor)
 
 
@@ -98,73 +224,88 @@ class RealDevice:
         # _LOGGER.warning(line)
         if not line:
             return
-        if "运动触发:" in line:
-            match = re.search(r'运动触发:\s*([是否])', line)
-            motion_on = False
-            if match:
-                motion_on = match.group(1).strip() == '是'
-            if motion_on != self.motion_on:
-                self.motion_on = motion_on
-                await self.update_value('motion_on', motion_on)
-        if "存在触发:" in line:
-            match = re.search(r'存在触发:\s*([是否])', line)
-            presence_on = False
-            if match:
-                presence_on = match.group(1).strip() == '是'
-            if presence_on != self.presence_on:
-                self.presence_on = presence_on
-                await self.update_value('presence_on', presence_on)
-        if "运动目标距离:" in line:
-            match = re.search(r'运动目标距离:\s*(\d+\s*cm|无)', line)
-            value = '无'
-            distance = None
-            if match:
-                value = match.group(1).strip()
-            if value == '无':
-                distance = None
-            else:
-                distance = int(value.replace('cm', ''))
-            if distance != self.motion_distance:
-                self.motion_distance = distance
-                await self.update_value('motion_distance', distance)
-        if "存在目标距离:" in line:
-            match = re.search(r'存在目标距离:\s*(\d+\s*cm|无)', line)
-            value = '无'
-            distance = None
-            if match:
-                value = match.group(1).strip()
-            if value == '无':
-                distance = None
-            else:
-                distance = int(value.replace('cm', ''))
-            if distance != self.presence_distance:
-                self.presence_distance = distance
-                await self.update_value('presence_distance', distance)
-        if "继电器" in line:
-            match = re.search(r'继电器\s*=\s*(.+)', line)
-            if match:
-                value = match.group(1).strip()
-                items = value.split(' ')
-                way_1 = items[0] == '1'
-                way_2 = items[1] == '1'
-                way_3 = items[2] == '1'
-                if way_1 != self.way_1:
-                    self.way_1 = way_1
-                    await self.update_value('way_1', way_1)
-                if way_2 != self.way_2:
-                    self.way_2 = way_2
-                    await self.update_value('way_2', way_2)
-                if way_3 != self.way_3:
-                    self.way_3 = way_3
-                    await self.update_value('way_3', way_3)
+        reading = parse_radar_line(line)
+        if reading is None:
+            return
+        # 一行中的所有变化合并为一次事件
+        changes = {}
+        if reading.motion_on is not None and reading.motion_on != self.motion_on:
+            self.motion_on = changes['motion_on'] = reading.motion_on
+        if reading.presence_on is not None and reading.presence_on != self.presence_on:
+            self.presence_on = changes['presence_on'] = reading.presence_on
+        if reading.has_motion_distance:
+            self._filter_distance('motion_distance', reading.motion_distance, changes)
+        if reading.has_presence_distance:
+            self._filter_distance('presence_distance', reading.presence_distance, changes)
+        if reading.motion_on is not None or reading.presence_on is not None:
+            self.radar_stats.add(
+                self.clock(),
+                self.motion_on,
+                self.presence_on,
+                reading.motion_distance if reading.has_motion_distance else None,
+                reading.presence_distance if reading.has_presence_distance else None,
+            )
+        if reading.relays is not None:
+            way_1, way_2, way_3 = reading.relays
+            if way_1 != self.way_1:
+                self.way_1 = changes['way_1'] = way_1
+            if way_2 != self.way_2:
+                self.way_2 = changes['way_2'] = way_2
+            if way_3 != self.way_3:
+                self.way_3 = changes['way_3'] = way_3
+        if changes:
+            await self.update_values(changes)
+
+    def stats_summary(self) -> dict:
+        """实体属性使用的最近窗口统计, 1 秒内重复读取时使用缓存"""
+        now = self.clock()
+        if self._stats_summary is None or now - self._stats_summary[0] >= 1:
+            self._stats_summary = (now, self.radar_stats.summary(RADAR_STATS_ATTRIBUTE_WINDOW, now))
+        return self._stats_summary[1]
+
+    def configure_distance_filter(self, kind: str, deadband: int, min_interval: float, window: int):
+        """设置距离传感器的死区(cm)、最小发布间隔(秒)和滑动平均窗口"""
+        self.distance_filters[f'{kind}_distance'].configure(deadband, min_interval, window)
+
+    def _filter_distance(self, key: str, value: int | None, changes: dict):
+        """距离读数经过滤波后才更新和发布"""
+        distance_filter = self.distance_filters[key]
+        publish, value = distance_filter.update(value, self.clock())
+        if publish and value != getattr(self, key):
+            setattr(self, key, value)
+            changes[key] = value
+        cancel = self._distance_flush_cancels.pop(key, None)
+        if cancel is not None:
+            cancel()
+        if distance_filter.has_pending:
+            delay = max(distance_filter.next_publish_at - self.clock(), 0)
+            self._distance_flush_cancels[key] = async_call_later(self.hass, delay, partial(self._flush_distance, key))
+
+    @callback
+    def _flush_distance(self, key: str, now=None):
+        """补发因间隔限制暂存的距离"""
+        self._distance_flush_cancels.pop(key, None)
+        publish, value = self.distance_filters[key].flush(self.clock())
+        if publish and value != getattr(self, key):
+            setattr(self, key, value)
+            self.hass.async_create_task(self.update_value(key, value))
 
     async def update_value(self, key: str, value: any):
         """更新指定键的值"""
-        # _LOGGER.warning(f"update_value {key} {value}")
-        self.hass.bus.async_fire(f"chuguan_xiaozhi_real_device_update_value", {key: value})
+        await self.update_values({key: value})
+
+    async def update_values(self, changes: dict):
+        """发布一行中变化的键, 每个键只通知订阅了它的实体
+
+        使用进程内的 dispatcher 而不是事件总线, 不会写入 recorder 的事件表。
+        """
+        # _LOGGER.warning(f"update_values {changes}")
+        for key, value in changes.items():
+            async_dispatcher_send(self.hass, real_device_signal(key), value)
 
     async def stop(self):
         """安全停止雷达监控"""
+        self.supervisor.cancel()
         if self._task:
             self._task.cancel()
             try:
@@ -184,6 +325,11 @@ class RealDevice:
                 _LOGGER.warning("Radar monitor process lookup not found.")
             except Exception as e:
                 _LOGGER.error(f"Error stopping radar monitor: {e}")
+        if self._link:
+            self._link.close()
+            self._link = None
+        if self.led_writer:
+            self.led_writer.reset()
         self.is_monitor = False
         await self.update_value('is_monitor', False)
 
@@ -197,7 +343,7 @@ class RealDevice:
         return False
     
     async def setWayOn(self, way: int, value: bool):
-        content = await async_execute_shell(['radar_key', '--relay', str(way - 1), '1' if value else '0'])
+        content = await self._command(['--relay', str(way - 1), '1' if value else '0'])
         await self.parse_line(content)
 
     async def getAllBrightness(self, on: bool) -> int:
@@ -207,26 +353,25 @@ class RealDevice:
         return 50
     
     async def setLed(self):
-        """设置LED状态, 2个亮度+3组RGB 长度20字节(关/开灯亮度0-100 + 3组灯开关灯色(先关灯色，后开灯色)"""
-        args = ['radar_key', '--led']
-        brightness_off = await self.getAllBrightness(False)
-        brightness_on = await self.getAllBrightness(True)
-        color_1_off = await self.getWayColor(1, False)
-        color_1_on = await self.getWayColor(1, True)
-        color_2_off = await self.getWayColor(2, False)
-        color_2_on = await self.getWayColor(2, True)
-        color_3_off = await self.getWayColor(3, False)
-        color_3_on = await self.getWayColor(3, True)
-        args.append(str(brightness_off))
-        args.append(str(brightness_on))
-        args.extend(map(str, color_1_off))
-        args.extend(map(str, color_1_on))
-        args.extend(map(str, color_2_off))  
-        args.extend(map(str, color_2_on))
-        args.extend(map(str, color_3_off))
-        args.extend(map(str, color_3_on))
-        # _LOGGER.warning(f"设置LED状态: {' '.join(args)}")
-        await async_execute_shell(args)
+        """设置LED状态, 2个亮度+3组RGB 长度20字节(关/开灯亮度0-100 + 3组灯开关灯色(先关灯色，后开灯色)
+
+        监控启动后交给 led_writer 合并写入, 拖动滑块或取色器时只写入最新状态。
+        """
+        keys = ['way_off_brightness', 'way_on_brightness']
+        for way in (1, 2, 3):
+            keys.extend([f'way_{way}_off_color', f'way_{way}_on_color'])
+        values = {}
+        if self.store:
+            values = await self.store.async_get_values(keys)
+        state = [int(values.get('way_off_brightness') or 50), int(values.get('way_on_brightness') or 50)]
+        for way in (1, 2, 3):
+            state.extend(map(int, self.way_color_value(values.get(f'way_{way}_off_color'), False)))
+            state.extend(map(int, self.way_color_value(values.get(f'way_{way}_on_color'), True)))
+        # _LOGGER.warning(f"设置LED状态: {state}")
+        if self.led_writer is None:
+            await self._command(['--led', *map(str, state)])
+            return
+        self.led_writer.submit(state)
        
     async def setAllBrightness(self, on: bool, value: int):
         status = 'on' if on else 'off'
@@ -234,15 +379,19 @@ class RealDevice:
             await self.store.async_set_key_value(f'way_{status}_brightness', value)
         await self.setLed()
 
+    def way_color_value(self, value, on: bool) -> tuple[int, int, int]:
+        if value and isinstance(value, list) and len(value) == 3:
+            return value
+        if on:
+            return [255, 0, 0]
+        return [0, 0, 255]
+
     async def getWayColor(self, way: int, on: bool) -> tuple[int, int, int]:
         status = 'on' if on else 'off'
+        value = None
         if self.store:
             value = await self.store.async_get_key_value(f'way_{way}_{status}_color')
-            if value and isinstance(value, list) and len(value) == 3:
-                return value
-        if on:
-            return [255, 0, 0]
-        return [0, 0, 255]
+        return self.way_color_value(value, on)
     
     async def setWayColor(self, way: int, on: bool, value: tuple[int, int, int]):
         status = 'on' if on else 'off'
@@ -259,25 +408,15 @@ class RealDevice:
             return self.motion_distance
         elif key == 'presence_distance':
             return self.presence_distance
-        res = ''
+        values = await self.getKVs([key])
+        return values[key]
+
+    async def getKVs(self, keys: list[str]) -> dict[str, str]:
+        """一次读取多个存储的参数, 未设置时使用默认值"""
+        stored = {}
         if self.store:
-            res = await self.store.async_get_key_value(f'kv_{key}') or ''
-        if res == '':
-            if key == 'motion_distance_min':
-                res = '100'
-            elif key == 'motion_distance_max':
-                res = '300'
-            elif key == 'motion_sensitivity':
-                res = '8'
-            elif key == 'presence_distance_min':
-                res = '100'
-            elif key == 'presence_distance_max':
-                res = '300'
-            elif key == 'presence_sensitivity':
-                res = '8'
-            elif key == 'presence_cycle':
-                res = '2'
-        return res
+            stored = await self.store.async_get_values([f'kv_{key}' for key in keys])
+        return {key: stored.get(f'kv_{key}') or KV_DEFAULTS.get(key, '') for key in keys}
     
     def modify_sensitivity(self,value: str | None) -> str:
         if value is None:
@@ -307,26 +446,27 @@ class RealDevice:
             radar_key = '--period'
             input_value = input_value * 60
         if radar_key:
-            await async_execute_shell(['radar_key', radar_key, str(int(input_value))])
+            await self._command([radar_key, str(int(input_value))])
 
     async def resetKeySetting(self):
-        value = await self.getKV('motion_distance_min')
-        args = ['radar_key', '--move-min', value if value else '100']
-        value = await self.getKV('motion_distance_max')
+        values = await self.getKVs(['motion_distance_min', 'motion_distance_max', 'motion_sensitivity', 'presence_distance_min', 'presence_distance_max', 'presence_sensitivity', 'presence_cycle'])
+        value = values['motion_distance_min']
+        args = ['--move-min', value if value else '100']
+        value = values['motion_distance_max']
         args.extend(['--move-max', value if value else '300'])
-        value = await self.getKV('motion_sensitivity')
+        value = values['motion_sensitivity']
         args.extend(['--move-sens', self.modify_sensitivity(value)])
-        value = await self.getKV('presence_distance_min')
+        value = values['presence_distance_min']
         args.extend(['--exist-min', value if value else '100'])
-        value = await self.getKV('presence_distance_max')
+        value = values['presence_distance_max']
         args.extend(['--exist-max', value if value else '300'])
-        value = await self.getKV('presence_sensitivity')
+        value = values['presence_sensitivity']
         args.extend(['--exist-sens', self.modify_sensitivity(value)])
-        value = await self.getKV('presence_cycle')
+        value = values['presence_cycle']
         input_value = float(value if value else '2') * 60
         args.extend(['--period', str(int(input_value))])
         # _LOGGER.warning(f"重置键设置: {' '.join(args)}")
-        await async_execute_shell(args)
+        await self._command(args)
 
     async def begin_learn(self):
         """开始环境学习"""
@@ -6,4 +6,62 @@ DOMAIN = 'chuguan-xiaozhi'
 STORAGE_VERSION = 1
 
 ACCESS_TOKEN_EXPIRATION_DAYS = 3650
-ACCESS_TOKEN_UPDATE_DAYS = 365
\ No newline at end of file
+ACCESS_TOKEN_UPDATE_DAYS = 365
+
+LOADER_SOCKET_PATH = "/tmp/frpc_loader.sock"
+
+SYNC_QUIET_SECONDS = 1
+SYNC_MAX_WAIT_SECONDS = 10
+
+STORAGE_SAVE_DELAY = 10
+STORAGE_OVER_BUDGET_SAVE_DELAY = 300
+DEFAULT_WRITE_BUDGET_KIB = 1024
+
+CONF_WRITE_BUDGET_KIB = "write_budget_kib"
+
+RADAR_BACKEND_CLI = "radar_key"
+RADAR_BACKEND_SERIAL = "serial"
+# 旧版本选项中的自动选择, 读取时换成 radar_key 或 serial
+RADAR_BACKEND_AUTO = "auto"
+CONF_RADAR_BACKEND = "radar_backend"
+DEFAULT_RADAR_BACKEND = RADAR_BACKEND_CLI
+CONF_RADAR_SERIAL_PORT = "radar_serial_port"
+DEFAULT_RADAR_SERIAL_PORT = ""
+CONF_RADAR_SERIAL_BAUDRATE = "radar_serial_baudrate"
+DEFAULT_RADAR_SERIAL_BAUDRATE = 115200
+RADAR_COMMAND_TIMEOUT = 3
+
+# 扩展板各个键的变化通过 dispatcher 按键分发, 格式化参数为键名
+REAL_DEVICE_SIGNAL = "chuguan_xiaozhi_real_device_{}"
+
+# LED 写入: 最后一次修改后静默 LED_WRITE_QUIET_SECONDS 秒写入, 连续修改时最多等待 LED_WRITE_MAX_WAIT_SECONDS 秒
+LED_WRITE_QUIET_SECONDS = 0.1
+LED_WRITE_MAX_WAIT_SECONDS = 0.5
+
+CONF_RELAY_OPTIMISTIC = "relay_optimistic"
+DEFAULT_RELAY_OPTIMISTIC = True
+RELAY_CONFIRM_TIMEOUT = 3
+
+# 雷达监控守护: 退出后按指数退避重启, 超过 stall 秒没有输出视为卡住, 0 表示不检测
+MONITOR_RESTART_MIN_DELAY = 1
+MONITOR_RESTART_MAX_DELAY = 300
+MONITOR_STALL_CHECK_SECONDS = 10
+CONF_RADAR_STALL_SECONDS = "radar_stall_seconds"
+DEFAULT_RADAR_STALL_SECONDS = 300
+
+# 距离传感器滤波, 选项键为 motion_/presence_ 前缀加以下名称
+DISTANCE_KINDS = ("motion", "presence")
+CONF_DISTANCE_DEADBAND = "distance_deadband"
+DEFAULT_DISTANCE_DEADBAND = 5
+CONF_DISTANCE_MIN_INTERVAL = "distance_min_interval"
+DEFAULT_DISTANCE_MIN_INTERVAL = 1
+CONF_DISTANCE_WINDOW = "distance_window"
+DEFAULT_DISTANCE_WINDOW = 1
+
+# 雷达统计环形缓冲区
+RADAR_STATS_CAPACITY = 4096
+RADAR_STATS_SPACING = 1
+RADAR_STATS_WINDOWS = (60, 600, 3600)
+RADAR_STATS_ATTRIBUTE_WINDOW = 600
+RADAR_STATS_BIN_CM = 50
+RADAR_STATS_BINS = 10
@@ -0,0 +1,81 @@
+from collections import deque
+
+
+class DistanceFilter:
+    """雷达目标距离滤波: 滑动平均 + 死区 + 最小发布间隔
+
+    目标出现或消失(无)时立即发布; 其余变化小于 deadband 时忽略, 距上次发布不足 min_interval 秒时暂存,
+    到时间后由 flush 补发最后的值。
+    """
+
+    def __init__(self, deadband: int = 0, min_interval: float = 0, window: int = 1):
+        self._samples: deque[int] = deque(maxlen=1)
+        self.configure(deadband, min_interval, window)
+        self.published: int | None = None
+        self.has_published = False
+        self.pending: int | None = None
+        self.has_pending = False
+        self.last_publish_at: float | None = None
+        self.stats = {
+            "samples": 0,
+            "published": 0,
+            "suppressed": 0,
+        }
+
+    def configure(self, deadband: int, min_interval: float, window: int):
+        self.deadband = max(int(deadband), 0)
+        self.min_interval = max(float(min_interval), 0.0)
+        self.window = max(int(window), 1)
+        self._samples = deque(self._samples, maxlen=self.window)
+
+    @property
+    def next_publish_at(self) -> float:
+        if self.last_publish_at is None:
+            return 0.0
+        return self.last_publish_at + self.min_interval
+
+    def update(self, value: int | None, now: float) -> tuple[bool, int | None]:
+        """输入一次读数, 返回 (是否发布, 当前发布值)"""
+        self.stats["samples"] += 1
+        if value is None:
+            self._samples.clear()
+            self.has_pending = False
+            if self.has_published and self.published is None:
+                return False, None
+            return self._publish(None, now)
+        self._samples.append(value)
+        smoothed = round(sum(self._samples) / len(self._samples))
+        if not self.has_published or self.published is None:
+            return self._publish(smoothed, now)
+        if smoothed == self.published or abs(smoothed - self.published) < self.deadband:
+            self.has_pending = False
+            self.stats["suppressed"] += 1
+            return False, self.published
+        if now < self.next_publish_at:
+            self.pending = smoothed
+            self.has_pending = True
+            self.stats["suppressed"] += 1
+            return False, self.published
+        return self._publish(smoothed, now)
+
+    def flush(self, now: float) -> tuple[bool, int | None]:
+        """发布因间隔限制暂存的值"""
+        if not self.has_pending or now < self.next_publish_at:
+            return False, self.published
+        return self._publish(self.pending, now)
+
+    def _publish(self, value: int | None, now: float) -> tuple[bool, int | None]:
+        self.published = value
+        self.has_published = True
+        self.has_pending = False
+        self.last_publish_at = now
+        self.stats["published"] += 1
+        return True, value
+
+    def as_dict(self) -> dict:
+        return {
+            "deadband": self.deadband,
+            "min_interval": self.min_interval,
+            "window": self.window,
+            **self.stats,
+        }
@@ -0,0 +1,172 @@
+from homeassistant.core import HomeAssistant
+from homeassistant.const import Platform
+from homeassistant.helpers.device_registry import async_get as async_get_device_registry, async_entries_for_area as async_devices_for_area
+from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry, async_entries_for_area, async_entries_for_device, RegistryEntry
+from homeassistant.helpers.area_registry import async_get as async_get_area_registry
+import logging
+import bisect
+from .payload import EntityRow, hash_row, format_digest, DIGEST_MODULUS
+
+PLATFORMS = [Platform.ALARM_CONTROL_PANEL, Platform.BUTTON, Platform.CLIMATE, Platform.COVER, Platform.FAN, Platform.HUMIDIFIER, Platform.LAWN_MOWER, Platform.LIGHT, Platform.LOCK, Platform.MEDIA_PLAYER, Platform.SCENE, Platform.SIREN, Platform.SWITCH, Platform.VACUUM, Platform.VALVE, Platform.WATER_HEATER]
+_LOGGER = logging.getLogger(__name__)
+
+
+class EntityChanges:
+    """一次增量同步的变更集"""
+
+    def __init__(self, upserts: dict[str, EntityRow], removes: list[str]):
+        self.upserts = upserts
+        self.removes = removes
+
+    def __bool__(self):
+        return bool(self.upserts) or bool(self.removes)
+
+
+class EntityIndex:
+    """已暴露实体的内存索引, 以 entity_id 为键"""
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self.rows: dict[str, EntityRow] = {}
+        self.dirty: set[str] = set()
+        self.is_loaded = False
+        self._digest = 0
+        self._sorted_ids: list[str] = []
+        self._device_areas: dict[str, str | None] = {}
+        self._area_names: dict[str, str | None] = {}
+
+    def mark_entity(self, entity_id: str | None):
+        """标记单个实体需要重新计算"""
+        if entity_id is not None:
+            self.dirty.add(entity_id)
+
+    def mark_device(self, device_id: str | None):
+        """标记设备下的所有实体"""
+        if device_id is None:
+            return
+        self._device_areas.pop(device_id, None)
+        entity_registry = async_get_entity_registry(self.hass)
+        for entity in async_entries_for_device(entity_registry, device_id, include_disabled_entities=True):
+            self.dirty.add(entity.entity_id)
+
+    def mark_area(self, area_id: str | None):
+        """标记区域下的所有实体, 包括通过设备归属该区域的实体"""
+        if area_id is None:
+            return
+        self._area_names.pop(area_id, None)
+        entity_registry = async_get_entity_registry(self.hass)
+        device_registry = async_get_device_registry(self.hass)
+        for entity in async_entries_for_area(entity_registry, area_id):
+            self.dirty.add(entity.entity_id)
+        for device in async_devices_for_area(device_registry, area_id):
+            self.mark_device(device.id)
+
+    def mark_all(self):
+        """下次同步时执行全量同步"""
+        self.is_loaded = False
+
+    def resolve_area_name(self, entity: RegistryEntry) -> str:
+        """实体所在区域的名称, 实体未设置区域时使用设备的区域"""
+        area_id = entity.area_id
+        if area_id is None and entity.device_id is not None:
+            if entity.device_id in self._device_areas:
+                area_id = self._device_areas[entity.device_id]
+            else:
+                device = async_get_device_registry(self.hass).devices.get(entity.device_id)
+                area_id = device.area_id if device is not None else None
+                self._device_areas[entity.device_id] = area_id
+        if area_id is None:
+            return ""
+        if area_id in self._area_names:
+            name = self._area_names[area_id]
+        else:
+            area = async_get_area_registry(self.hass).areas.get(area_id)
+            name = area.name if area is not None else None
+            self._area_names[area_id] = name
+        return name if name is not None else ""
+
+    def build_row(self, entity: RegistryEntry | None) -> EntityRow | None:
+        """生成实体的上报行, 不需要暴露时返回 None"""
+        if entity is None:
+            return None
+        if entity.disabled:
+            return None
+        if entity.entity_category is not None and entity.entity_category == 'diagnostic':
+            return None
+        conversation = entity.options.get('conversation', {})
+        if conversation.get('should_expose', True) is False:
+            return None
+        if entity.domain not in PLATFORMS:
+            return None
+        name = entity.name if entity.name is not None else entity.original_name
+        if name is None:
+            name = entity.entity_id.split('.')[1]
+        return (self.resolve_area_name(entity), name, entity.entity_id)
+
+    def rebuild(self) -> list[EntityRow]:
+        """全量重建索引, 返回按 entity_id 排序的上报行"""
+        entity_registry = async_get_entity_registry(self.hass)
+        self._device_areas.clear()
+        self._area_names.clear()
+        rows: dict[str, EntityRow] = {}
+        for entity in entity_registry.entities.values():
+            row = self.build_row(entity)
+            if row is not None:
+                rows[entity.entity_id] = row
+        self._sorted_ids = sorted(rows)
+        self.rows = {entity_id: rows[entity_id] for entity_id in self._sorted_ids}
+        self._digest = sum(map(hash_row, rows.values())) % DIGEST_MODULUS
+        self.dirty.clear()
+        self.is_loaded = True
+        return list(self.rows.values())
+
+    def take_changes(self) -> EntityChanges:
+        """取出脏实体并计算增量, 上报失败时需调用 restore 或改为全量同步"""
+        entity_registry = async_get_entity_registry(self.hass)
+        dirty = self.dirty
+        self.dirty = set()
+        upserts: dict[str, EntityRow] = {}
+        removes: list[str] = []
+        for entity_id in sorted(dirty):
+            row = self.build_row(entity_registry.async_get(entity_id))
+            old_row = self.rows.get(entity_id)
+            if row == old_row:
+                continue
+            if row is None:
+                removes.append(entity_id)
+            else:
+                upserts[entity_id] = row
+        return EntityChanges(upserts, removes)
+
+    def commit(self, changes: EntityChanges):
+        """上报成功后应用增量"""
+        digest = self._digest
+        for entity_id in changes.removes:
+            old_row = self.rows.pop(entity_id, None)
+            if old_row is not None:
+                digest -= hash_row(old_row)
+                index = bisect.bisect_left(self._sorted_ids, entity_id)
+                del self._sorted_ids[index]
+        for entity_id, row in changes.upserts.items():
+            old_row = self.rows.get(entity_id)
+            if old_row is not None:
+                digest -= hash_row(old_row)
+            else:
+                bisect.insort(self._sorted_ids, entity_id)
+            digest += hash_row(row)
+            self.rows[entity_id] = row
+        self._digest = digest % DIGEST_MODULUS
+
+    def restore(self, changes: EntityChanges):
+        """上报失败时重新标记实体"""
+        self.dirty.update(changes.upserts.keys())
+        self.dirty.update(changes.removes)
+
+    @property
+    def digest(self) -> str:
+        """当前已暴露实体集合的指纹"""
+        return format_digest(self._digest)
+
+    def get_rows(self) -> list[EntityRow]:
+        """按 entity_id 排序的全部上报行"""
+        return [self.rows[entity_id] for entity_id in self._sorted_ids]
@@ -0,0 +1,36 @@
+from urllib.parse import urlencode
+from functools import lru_cache
+import pyqrcode
+import base64
+import io
+from PIL import Image, ImageOps
+
+
+@lru_cache(maxsize=4)
+def render_host_qrcode(host: str) -> str:
+    """生成系统地址二维码, 返回 base64 编码的 PNG; 结果按 host 缓存, 需在 executor 中调用"""
+    # 1. 准备内容
+    params = {
+        "address": host
+    }
+    qr_content = "https://xcx.chuguankj.com/haapi/public/address.html?" + urlencode(params)
+
+    # 2. 生成二维码对象
+    qr = pyqrcode.create(qr_content)
+
+    # 1. 生成 XBM 数据
+    xbm_str = qr.xbm(scale=10)
+
+    # 2. 用 Pillow 加载 XBM (此时可能是白字黑底或透明)
+    raw_img = Image.open(io.BytesIO(xbm_str.encode()))
+
+    # --- 核心修正点在这里 ---
+    # 将图像模式转为 L (灰度)，方便进行反转操作
+    raw_img = raw_img.convert("L")
+    # 执行反转：黑变白，白变黑
+    raw_img = ImageOps.invert(raw_img)
+
+    # 5. 导出 Base64
+    buffer = io.BytesIO()
+    raw_img.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
@@ -1,32 +1,31 @@
-from urllib.parse import urlencode
 from homeassistant.core import HomeAssistant, callback, Event, EventStateChangedData
 from homeassistant.config_entries import ConfigEntries
 from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.typing import NoEventData, ConfigType
-from homeassistant.const import EVENT_HOMEASSISTANT_STARTED, EVENT_STATE_CHANGED
-from homeassistant.helpers.device_registry import EventDeviceRegistryUpdatedData, async_get as async_get_device_registry
-from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry, EVENT_ENTITY_REGISTRY_UPDATED, EventEntityRegistryUpdatedData
-from homeassistant.helpers.area_registry import async_get as async_get_area_registry, EVENT_AREA_REGISTRY_UPDATED, EventAreaRegistryUpdatedData
-from homeassistant.helpers.event import async_call_later
+from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
+from homeassistant.helpers.device_registry import EventDeviceRegistryUpdatedData
+from homeassistant.helpers.entity_registry import EVENT_ENTITY_REGISTRY_UPDATED, EventEntityRegistryUpdatedData
+from homeassistant.helpers.area_registry import EVENT_AREA_REGISTRY_UPDATED, EventAreaRegistryUpdatedData
 from homeassistant.const import EVENT_CORE_CONFIG_UPDATE
 import logging
-from homeassistant.const import Platform
 from datetime import datetime
 from .utils import send_messages
-import json
+from .loader import loader_client
 from datetime import timedelta
 from .store import MyStore
-from .const import ACCESS_TOKEN_EXPIRATION_DAYS, ACCESS_TOKEN_UPDATE_DAYS
-from homeassistant.helpers.event import async_track_time_interval
-import pyqrcode
-import base64
-import io
+from .const import ACCESS_TOKEN_EXPIRATION_DAYS, ACCESS_TOKEN_UPDATE_DAYS, SYNC_QUIET_SECONDS, SYNC_MAX_WAIT_SECONDS, CONF_WRITE_BUDGET_KIB, DEFAULT_WRITE_BUDGET_KIB
+from .const import CONF_RADAR_BACKEND, DEFAULT_RADAR_BACKEND, CONF_RADAR_SERIAL_PORT, DEFAULT_RADAR_SERIAL_PORT, CONF_RADAR_SERIAL_BAUDRATE, DEFAULT_RADAR_SERIAL_BAUDRATE
+from .const import CONF_RELAY_OPTIMISTIC, DEFAULT_RELAY_OPTIMISTIC, CONF_RADAR_STALL_SECONDS, DEFAULT_RADAR_STALL_SECONDS
+from .const import DISTANCE_KINDS, CONF_DISTANCE_DEADBAND, DEFAULT_DISTANCE_DEADBAND, CONF_DISTANCE_MIN_INTERVAL, DEFAULT_DISTANCE_MIN_INTERVAL, CONF_DISTANCE_WINDOW, DEFAULT_DISTANCE_WINDOW
+from homeassistant.helpers.event import async_track_time_interval, async_track_state_change_event
 from homeassistant.components import persistent_notification
-from PIL import Image, ImageOps
-from .weather import met_weather_state_changed, check_all_met_weather
+from .host_qrcode import render_host_qrcode
+from .weather import met_weather_state_changed, check_all_met_weather, get_met_weather_entity_ids
 from .RealDevice import realDevice
+from .entity_index import EntityIndex, EntityChanges
+from .scheduler import CoalescingScheduler, SingleFlight
+from .payload import EntityRow, encode_entities, encode_entity_changes
 
-PLATFORMS = [Platform.ALARM_CONTROL_PANEL, Platform.BUTTON, Platform.CLIMATE, Platform.COVER, Platform.FAN, Platform.HUMIDIFIER, Platform.LAWN_MOWER, Platform.LIGHT, Platform.LOCK, Platform.MEDIA_PLAYER, Platform.SCENE, Platform.SIREN, Platform.SWITCH, Platform.VACUUM, Platform.VALVE, Platform.WATER_HEATER]
 _LOGGER = logging.getLogger(__name__)
 
 class Hub:
@@ -35,7 +34,6 @@ class Hub:
     def __init__(self, hass: HomeAssistant, entry: ConfigEntries | None):
         self.hass = hass
         self.entry = entry
-        self.later_update_cancel = None
         self.interval_update_cancel = None
         self.cancel1 = None
         self.cancel2 = None
@@ -43,10 +41,16 @@ class Hub:
         self.cancel4 = None
         self.cancel5 = None
         self.cancel6 = None
+        self.weather_entity_ids: list[str] = []
         self.is_setup = False
         self.store = MyStore(hass)
-        self.isSendNotification = False
+        self.notified_host: str | None = None
+        self.token_state: dict | None = None
+        self.check_token_interval = None
         self.host = ""
+        self.entity_index = EntityIndex(hass)
+        self.sync_flight = SingleFlight("Entity sync", self._do_update_entities)
+        self.sync_scheduler = CoalescingScheduler(hass, "Entity sync", self.do_update_entities, SYNC_QUIET_SECONDS, SYNC_MAX_WAIT_SECONDS)
         if self.hass.state == "running":
             self.update_entities()
         realDevice.hass = hass
@@ -85,10 +89,16 @@ class Hub:
             self.cancel6()
             self.cancel6 = None
         self.remove_interval_update()
+        self.sync_scheduler.cancel()
         if self.check_weather_interval is not None:
             self.check_weather_interval()
             self.check_weather_interval = None
+        if self.check_token_interval is not None:
+            self.check_token_interval()
+            self.check_token_interval = None
         await realDevice.stop()
+        await loader_client.close()
+        await self.store.async_flush()
 
     async def setup(self):
         """Setup the Chuguan Xiaozhi hub"""
@@ -101,9 +111,10 @@ class Hub:
         self.cancel3 = self.hass.bus.async_listen(EVENT_ENTITY_REGISTRY_UPDATED, self._on_entity_registry_updated)
         self.cancel4 = self.hass.bus.async_listen(EVENT_AREA_REGISTRY_UPDATED, self._on_area_registry_updated)
         self.cancel5 = self.hass.bus.async_listen(EVENT_CORE_CONFIG_UPDATE, self._on_core_config_updated)
-        self.cancel6 = self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._on_state_changed)
+        self.track_weather_state()
         self.setup_later_update()
         self.check_weather_interval = async_track_time_interval(self.hass, self.interval_check_weather, timedelta(minutes=1))
+        self.check_token_interval = async_track_time_interval(self.hass, self.interval_check_token, timedelta(days=1))
         await realDevice.start(self.hass)
         install_version = await self.store.async_get_key_value('install_version')
         if install_version is None:
@@ -111,6 +122,54 @@ class Hub:
             formatted_date = now.strftime("%Y.%-m.%-d")
             await self.store.async_set_key_value('install_version', formatted_date)
 
+    def apply_options(self, options: dict):
+        """应用集成选项"""
+        self.store.set_write_budget(options.get(CONF_WRITE_BUDGET_KIB, DEFAULT_WRITE_BUDGET_KIB))
+        changed = realDevice.configure_backend(
+            options.get(CONF_RADAR_BACKEND, DEFAULT_RADAR_BACKEND),
+            options.get(CONF_RADAR_SERIAL_PORT, DEFAULT_RADAR_SERIAL_PORT),
+            options.get(CONF_RADAR_SERIAL_BAUDRATE, DEFAULT_RADAR_SERIAL_BAUDRATE),
+        )
+        realDevice.relay_optimistic = options.get(CONF_RELAY_OPTIMISTIC, DEFAULT_RELAY_OPTIMISTIC)
+        realDevice.supervisor.set_stall_seconds(options.get(CONF_RADAR_STALL_SECONDS, DEFAULT_RADAR_STALL_SECONDS))
+        for kind in DISTANCE_KINDS:
+            realDevice.configure_distance_filter(
+                kind,
+                options.get(f"{kind}_{CONF_DISTANCE_DEADBAND}", DEFAULT_DISTANCE_DEADBAND),
+                options.get(f"{kind}_{CONF_DISTANCE_MIN_INTERVAL}", DEFAULT_DISTANCE_MIN_INTERVAL),
+                options.get(f"{kind}_{CONF_DISTANCE_WINDOW}", DEFAULT_DISTANCE_WINDOW),
+            )
+        if changed and self.is_setup:
+            # 已经启动过监控时按新的通信方式重启
+            self.hass.async_create_task(realDevice.start(self.hass))
+
+    def get_diagnostics(self) -> dict:
+        """集成诊断信息"""
+        return {
+            "options": dict(self.entry.options) if self.entry is not None else {},
+            "storage": self.store.stats.as_dict(),
+            "sync": {
+                "entities": len(self.entity_index.rows),
+                "scheduler": dict(self.sync_scheduler.stats),
+                "single_flight": dict(self.sync_flight.stats),
+            },
+            "loader": {
+                "connected": loader_client.is_connected,
+                "legacy": loader_client.legacy,
+                "features": list(loader_client.features),
+            },
+            "radar": {
+                "backend": realDevice.backend,
+                "serial": realDevice.use_serial(),
+                "is_monitor": realDevice.is_monitor,
+                "command_channel": dict(realDevice.channel.stats),
+                "led": dict(realDevice.led_writer.stats) if realDevice.led_writer else {},
+                "monitor": realDevice.supervisor.as_dict(),
+                "stats": realDevice.radar_stats.as_dict(realDevice.clock()),
+                "distance_filters": {key: distance_filter.as_dict() for key, distance_filter in realDevice.distance_filters.items()},
+            },
+        }
+
     def setup_later_update(self):
         _LOGGER.info("Setup later update")
         self.remove_interval_update()
@@ -136,6 +195,21 @@ class Hub:
              for config_entry in config_entries:
                  res = await self.hass.config_entries.async_reload(config_entry.entry_id)
 
+    @callback
+    def track_weather_state(self):
+        """只监听 met 天气实体的状态变化, 实体列表变化时重新订阅"""
+        entity_ids = get_met_weather_entity_ids(self.hass)
+        if self.cancel6 is not None and entity_ids == self.weather_entity_ids:
+            return
+        if self.cancel6 is not None:
+            self.cancel6()
+            self.cancel6 = None
+        self.weather_entity_ids = entity_ids
+        if len(entity_ids) == 0:
+            return
+        _LOGGER.info("Track weather state: %s", entity_ids)
+        self.cancel6 = async_track_state_change_event(self.hass, entity_ids, self._on_state_changed)
+
     @callback
     async def _on_state_changed(self, ev: Event[EventStateChangedData]):
         """Handle state changed event."""
@@ -148,23 +222,33 @@ class Hub:
     def _on_device_registry_updated(self, ev: Event[EventDeviceRegistryUpdatedData]):
         """Handle device registry updated event."""
         _LOGGER.info("Device registry updated: %s", ev)
+        data = ev.data
+        # 设备的其他字段不影响上报内容, 只有区域变化时才需要重新计算
+        if data.get('action') != 'update' or 'area_id' in data.get('changes', {}):
+            self.entity_index.mark_device(data.get('device_id'))
         self.update_entities()
 
     @callback
     def _on_entity_registry_updated(self, ev: Event[EventEntityRegistryUpdatedData]):
         """Handle entity registry updated event."""
         _LOGGER.info("Entity registry updated: %s", ev)
+        self.entity_index.mark_entity(ev.data.get('entity_id'))
+        self.entity_index.mark_entity(ev.data.get('old_entity_id'))
+        entity_ids = (ev.data.get('entity_id') or '', ev.data.get('old_entity_id') or '')
+        if self.is_setup and any(entity_id.startswith('weather.') for entity_id in entity_ids):
+            self.track_weather_state()
         self.update_entities()
 
     @callback
     def _on_area_registry_updated(self, ev: Event[EventAreaRegistryUpdatedData]):
         """Handle area registry updated event."""
         _LOGGER.info("Area registry updated: %s", ev)
+        self.entity_index.mark_area(ev.data.get('area_id'))
         self.update_entities()
 
     def interval_update_entities(self, now: datetime):
-        """定时更新实体"""
-        self.hass.create_task(self.do_update_entities())
+        """定时全量更新实体"""
+        self.hass.create_task(self.do_update_entities(full=True))
 
     def interval_check_weather(self, now: datetime):
         """定时检查天气状态"""
@@ -172,74 +256,88 @@ class Hub:
 
     def update_entities(self):
         """Update entities"""
-        if self.later_update_cancel is not None:
-            self.later_update_cancel()
-            self.later_update_cancel = None
-        self.later_update_cancel = async_call_later(self.hass, 1, self._update_entities)
+        self.sync_scheduler.trigger()
 
-    @callback
-    async def _update_entities(self, now: datetime = None):
+    async def do_update_entities(self, full: bool = False):
         """Get all data from the hub"""
-        await self.do_update_entities()
+        await self.sync_flight.run(full)
 
-    async def do_update_entities(self):
-        """Get all data from the hub"""
-        update_entities = self.get_all_entities()
+    async def _do_update_entities(self, full: bool):
+        """同步实体, 由 sync_flight 保证同一时间只有一次执行"""
         access_token = await self.setup_refresh_token()
-        stored_data = await self.store.async_get_devices()
         api_key = await self.store.async_get_api_key()
         await self.check_host()
-        if stored_data == update_entities and api_key == access_token:
+        if full or not self.entity_index.is_loaded or api_key != access_token:
+            await self.do_full_update_entities(access_token, force=full)
+            return
+        changes = self.entity_index.take_changes()
+        if not changes:
             _LOGGER.info("No update entities")
             return
-        await self.upload_entities(update_entities, access_token)
-        await self.store.async_set_devices(update_entities)
-        await self.store.async_set_api_key(access_token)
+        success, resync = await self.upload_entity_changes(changes, access_token)
+        if not success:
+            # 增量被拒绝或发送失败时改为全量同步, 全量也失败时下次同步仍然是全量
+            _LOGGER.warning("Upload entity changes failed, falling back to full sync")
+            await self.do_full_update_entities(access_token, force=True)
+            return
+        self.entity_index.commit(changes)
+        if resync:
+            await self.do_full_update_entities(access_token, force=True)
+            return
+        await self.store.async_set_devices_digest(self.entity_index.digest, access_token)
 
-    async def upload_entities(self, entities: list[str], api_key: str):
+    async def do_full_update_entities(self, access_token: str, force: bool = False):
+        """全量同步实体, force 为 True 时即使没有变化也重新上报"""
+        rows = self.entity_index.rebuild()
+        digest = self.entity_index.digest
+        stored_digest = await self.store.async_get_devices_digest()
+        api_key = await self.store.async_get_api_key()
+        if not force and stored_digest == digest and api_key == access_token:
+            _LOGGER.info("No update entities")
+            return
+        success = await self.upload_entities(rows, access_token)
+        if not success:
+            self.entity_index.mark_all()
+            return
+        await self.store.async_set_devices_digest(digest, access_token)
+
+    async def upload_entities(self, entities: list[EntityRow], api_key: str):
         """Upload entities"""
-        _LOGGER.info(f"Upload entities: {entities}")
-        data = {
-            "devices": ";".join(entities),
-            "apiKey": api_key
-        }
-        message = json.dumps(data, ensure_ascii=False)
-        res = await send_messages(message)
+        _LOGGER.info(f"Upload entities: {len(entities)}")
+        features = await loader_client.async_get_features()
+        data = encode_entities(entities, api_key, features)
+        res = await send_messages(data)
         if res is None:
             return False
         return res.success
-    
+
+    async def upload_entity_changes(self, changes: EntityChanges, api_key: str):
+        """增量上报实体, 返回 (是否成功, 对端是否要求全量同步)"""
+        _LOGGER.info(f"Upload entity changes: {list(changes.upserts.values())} removed: {changes.removes}")
+        features = await loader_client.async_get_features()
+        data = encode_entity_changes(list(changes.upserts.values()), changes.removes, api_key, features)
+        res = await send_messages(data)
+        if res is None or not res.success:
+            return False, False
+        resync = isinstance(res.data, dict) and res.data.get("resync") is True
+        return True, resync
+
     def get_all_entities(self):
-        device_registry = async_get_device_registry(self.hass)
-        area_registry = async_get_area_registry(self.hass)
-        entity_registry = async_get_entity_registry(self.hass)
-        entities = list(entity_registry.entities.values())
-        entities.sort(key=lambda x: (x.entity_id))
-        update_entities: list[str] = []
-        for entity in entities:
-            if entity.disabled:
-                continue
-            if entity.entity_category is not None and entity.entity_category == 'diagnostic':
-                continue
-            conversation = entity.options.get('conversation', {})
-            if conversation.get('should_expose', True) is False:
-                continue
-            if entity.domain in PLATFORMS:
-                name = entity.name if entity.name is not None else entity.original_name
-                if name is None:
-                    name = entity.entity_id.split('.')[1]
-                area = entity.area_id
-                if area is None and entity.device_id is not None:
-                    area = device_registry.devices[entity.device_id].area_id
-                if area is not None:
-                    area = area_registry.areas[area].name
-                if area is None:
-                    area = ""
-                update_entities.append(f"{area},{name},{entity.entity_id}")
-        return update_entities
+        """全部已暴露实体的上报行"""
+        if not self.entity_index.is_loaded:
+            return self.entity_index.rebuild()
+        return self.entity_index.get_rows()
 
     async def setup_refresh_token(self, now: datetime = None):
         """Setup API key"""
+        state = self.token_state
+        if state is not None and datetime.now().timestamp() < state["rotate_at"]:
+            return state["access_token"]
+        return await self.refresh_token_state()
+
+    async def refresh_token_state(self):
+        """从 auth 和 store 加载 token, 需要时轮换, 并计算下次检查时间"""
+        self.token_state = None
         users = await self.hass.auth.async_get_users()
         filtered_users = [user for user in users if user.is_owner == True]
         if len(filtered_users) == 0:
@@ -247,6 +345,7 @@ class Hub:
         user = filtered_users[0]
         ole_refresh_token, old_access_token = await self.check_refresh_token(user.id)
         if ole_refresh_token is not None:
+            self.set_token_state(ole_refresh_token, old_access_token)
             return old_access_token
         now = datetime.now().strftime("%Y-%m-%d")
         refresh_token = await self.hass.auth.async_create_refresh_token(
@@ -255,11 +354,36 @@ class Hub:
             token_type="long_lived_access_token", 
             access_token_expiration=timedelta(days=ACCESS_TOKEN_EXPIRATION_DAYS))
         access_token = self.hass.auth.async_create_access_token(refresh_token)
-        refresh_token.expire_at
         await self.store.async_set_token(user.id, refresh_token.id, access_token, refresh_token.expire_at)
         _LOGGER.info("create Refresh token: %s", refresh_token.id)
+        self.set_token_state(refresh_token, access_token)
         return access_token
-    
+
+    def set_token_state(self, refresh_token, access_token: str):
+        """缓存 token, 到期前 ACCESS_TOKEN_UPDATE_DAYS 天需要轮换"""
+        expire_at = refresh_token.created_at + refresh_token.access_token_expiration
+        rotate_at = expire_at - timedelta(days=ACCESS_TOKEN_UPDATE_DAYS)
+        self.token_state = {
+            "token_id": refresh_token.id,
+            "access_token": access_token,
+            "rotate_at": rotate_at.timestamp(),
+        }
+
+    def interval_check_token(self, now: datetime):
+        """定时检查 token 是否仍然有效或需要轮换"""
+        self.hass.create_task(self.async_check_token())
+
+    async def async_check_token(self):
+        """检查 token, 发生轮换时触发同步以上报新的 api key"""
+        state = self.token_state
+        old_access_token = state["access_token"] if state is not None else None
+        if state is not None and self.hass.auth.async_get_refresh_token(state["token_id"]) is not None and datetime.now().timestamp() < state["rotate_at"]:
+            return
+        access_token = await self.refresh_token_state()
+        if access_token != old_access_token:
+            _LOGGER.info("Access token changed, update entities")
+            self.update_entities()
+
     async def check_refresh_token(self, user_id: str):
         """Check refresh token"""
         token = await self.store.async_get_token(user_id)
@@ -302,8 +426,7 @@ class Hub:
         """Check host"""
         old_host = await self.store.async_get_host()
         try:
-            message = json.dumps({"action": "host"}, ensure_ascii=False)
-            res = await send_messages(message)
+            res = await send_messages({"action": "host"})
             if res is None:
                 return old_host
             if not res.success:
@@ -320,37 +443,12 @@ class Hub:
     
     async def send_host_notification(self, host: str):
         """Send host notification"""
-        _LOGGER.info("send host notification %s", host)
         if host is None:
             return
-        if self.isSendNotification:
+        if host == self.notified_host:
             return
-        
-        # 1. 准备内容
-        params = {
-            "address": host
-        }
-        qr_content = "https://xcx.chuguankj.com/haapi/public/address.html?" + urlencode(params)
-        
-        # 2. 生成二维码对象
-        qr = pyqrcode.create(qr_content)
-
-        # 1. 生成 XBM 数据
-        xbm_str = qr.xbm(scale=10)
-        
-        # 2. 用 Pillow 加载 XBM (此时可能是白字黑底或透明)
-        raw_img = Image.open(io.BytesIO(xbm_str.encode()))
-        
-        # --- 核心修正点在这里 ---
-        # 将图像模式转为 L (灰度)，方便进行反转操作
-        raw_img = raw_img.convert("L")
-        # 执行反转：黑变白，白变黑
-        raw_img = ImageOps.invert(raw_img)
-
-        # 5. 导出 Base64
-        buffer = io.BytesIO()
-        raw_img.save(buffer, format="PNG")
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        _LOGGER.info("send host notification %s", host)
+        img_str = await self.hass.async_add_executor_job(render_host_qrcode, host)
 
         # 4. 发送通知（使用最基础的 img 标签，不加复杂 style）
         message = (
@@ -366,7 +464,7 @@ class Hub:
             title="系统地址",
             notification_id="home_assistant_host_notification"
         )
-        # self.isSendNotification = True
+        self.notified_host = host
 
 instance: Hub | None = None
 
@@ -0,0 +1,54 @@
+from collections.abc import Awaitable, Callable
+from homeassistant.core import HomeAssistant, callback
+from .scheduler import CoalescingScheduler, SingleFlight
+from .const import LED_WRITE_QUIET_SECONDS, LED_WRITE_MAX_WAIT_SECONDS
+
+# 2 个亮度 + 3 组关灯色/开灯色
+LED_STATE_LENGTH = 20
+
+
+class LedWriter:
+    """按键背光 LED 写入
+
+    只保留最新的目标状态, 连续修改合并后按有限的频率写入, 与上次成功写入的状态相同时跳过。
+    """
+
+    def __init__(self, hass: HomeAssistant, send: Callable[[list[str]], Awaitable[str | None]]):
+        self.send = send
+        self.desired: tuple[int, ...] | None = None
+        self.sent: tuple[int, ...] | None = None
+        self.flight = SingleFlight("LED write", self._write)
+        self.scheduler = CoalescingScheduler(hass, "LED write", self.flight.run, LED_WRITE_QUIET_SECONDS, LED_WRITE_MAX_WAIT_SECONDS)
+        self.stats = {
+            "requests": 0,
+            "writes": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+
+    @callback
+    def submit(self, state: list[int]):
+        """设置目标状态, 稍后写入"""
+        if len(state) != LED_STATE_LENGTH:
+            raise ValueError(f"LED state must have {LED_STATE_LENGTH} values, got {len(state)}")
+        self.stats["requests"] += 1
+        self.desired = tuple(state)
+        self.scheduler.trigger()
+
+    async def _write(self, full: bool = False):
+        desired = self.desired
+        if desired is None or desired == self.sent:
+            self.stats["skipped"] += 1
+            return
+        result = await self.send(["--led", *map(str, desired)])
+        if result is None:
+            # 写入失败时保留旧状态, 下次修改会重新写入
+            self.stats["failed"] += 1
+            return
+        self.sent = desired
+        self.stats["writes"] += 1
+
+    def reset(self):
+        """扩展板可能已重置, 取消待写入并在下次修改时强制写入"""
+        self.scheduler.cancel()
+        self.sent = None
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import struct
+import time
+from .model import SockResponse
+from .const import LOADER_SOCKET_PATH
+
+_LOGGER = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+HELLO_TIMEOUT = 3
+REQUEST_TIMEOUT = 30
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 60
+
+
+class LoaderClient:
+    """frpc_loader 长连接客户端
+
+    每帧为 4 字节大端长度 + UTF-8 JSON, 请求带 id, 响应按 id 匹配, 多个请求可以同时在途。
+    连接建立时发送 hello 协商, 对端不支持分帧时退回到每条消息一个连接的旧协议。
+    """
+
+    def __init__(self, path: str = LOADER_SOCKET_PATH):
+        self.path = path
+        self.features: list[str] = []
+        self.legacy = False
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 1
+        self._connect_lock = asyncio.Lock()
+        self._backoff = RECONNECT_MIN_DELAY
+        self._next_connect_at = 0.0
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def request(self, data: dict, timeout: float = REQUEST_TIMEOUT) -> SockResponse | None:
+        """发送请求并等待响应, 失败时返回 None"""
+        try:
+            if not await self._ensure_connected():
+                return None
+            if self.legacy:
+                return await self._request_legacy(data)
+            return await self._request_framed(data, timeout)
+        except Exception as e:
+            _LOGGER.error(f"write to {self.path} error: {e}")
+            return None
+
+    async def async_get_features(self) -> list[str]:
+        """建立连接并返回对端支持的特性"""
+        try:
+            await self._ensure_connected()
+        except Exception as e:
+            _LOGGER.error(f"connect to {self.path} error: {e}")
+        return self.features
+
+    async def close(self):
+        """关闭连接并取消所有在途请求"""
+        await self._disconnect(ConnectionError("loader client closed"))
+        self.legacy = False
+        self.features = []
+        self._backoff = RECONNECT_MIN_DELAY
+        self._next_connect_at = 0.0
+
+    async def _ensure_connected(self) -> bool:
+        if self.legacy or self.is_connected:
+            return True
+        async with self._connect_lock:
+            if self.legacy or self.is_connected:
+                return True
+            if time.monotonic() < self._next_connect_at:
+                return False
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except Exception as e:
+                _LOGGER.error(f"connect to {self.path} error: {e}, retry in {self._backoff}s")
+                self._schedule_reconnect()
+                return False
+            self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+            try:
+                res = await self._request_framed({"action": "hello", "framing": 1}, HELLO_TIMEOUT)
+            except asyncio.TimeoutError:
+                _LOGGER.warning(f"{self.path} does not support framing, fallback to legacy protocol")
+                await self._disconnect(ConnectionError("legacy loader"))
+                self.legacy = True
+                return True
+            except Exception as e:
+                self._schedule_reconnect()
+                _LOGGER.error(f"handshake with {self.path} error: {e}")
+                return False
+            if res.success and isinstance(res.data, dict):
+                self.features = list(res.data.get("features", []))
+            self._backoff = RECONNECT_MIN_DELAY
+            _LOGGER.info(f"connected to {self.path}, features: {self.features}")
+            return True
+
+    def _schedule_reconnect(self):
+        self._next_connect_at = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, RECONNECT_MAX_DELAY)
+
+    async def _request_framed(self, data: dict, timeout: float) -> SockResponse:
+        request_id = self._next_id
+        self._next_id += 1
+        body = json.dumps({**data, "id": request_id}, ensure_ascii=False).encode()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(FRAME_HEADER.pack(len(body)) + body)
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self):
+        """读取响应帧并分发给对应的请求"""
+        error: Exception = ConnectionError("loader connection closed")
+        try:
+            while True:
+                header = await self._reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                body = await self._reader.readexactly(length)
+                obj = json.loads(body)
+                future = self._pending.get(obj.pop("id", None))
+                if future is None or future.done():
+                    continue
+                future.set_result(SockResponse.model_validate(obj))
+        except asyncio.CancelledError:
+            return
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            _LOGGER.error(f"read from {self.path} error: {e}")
+            error = e
+        self._read_task = None
+        self._schedule_reconnect()
+        await self._disconnect(error)
+
+    async def _disconnect(self, error: Exception):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        pending = self._pending
+        self._pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _request_legacy(self, data: dict) -> SockResponse | None:
+        """旧协议: 每条消息一个连接, 写完半关闭后读取响应"""
+        writer = None
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(json.dumps(data, ensure_ascii=False).encode())
+            await writer.drain()   # 确保发送出去
+            writer.write_eof()     # 相当于 shutdown(SHUT_WR)
+            response = await reader.read()
+            res = response.decode()
+            _LOGGER.info(res)
+            return SockResponse.model_validate_json(res)
+        finally:
+            if writer is not None:
+                writer.close()
+                await writer.wait_closed()
+
+
+loader_client = LoaderClient()
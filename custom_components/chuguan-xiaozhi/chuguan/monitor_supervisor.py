@@ -0,0 +1,169 @@
+from collections import deque
+from collections.abc import Callable, Coroutine
+from datetime import timedelta
+from typing import Any
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+import logging
+import time
+from .const import MONITOR_RESTART_MIN_DELAY, MONITOR_RESTART_MAX_DELAY, MONITOR_STALL_CHECK_SECONDS, DEFAULT_RADAR_STALL_SECONDS
+
+_LOGGER = logging.getLogger(__name__)
+
+RECENT_OUTAGES = 10
+
+
+class MonitorSupervisor:
+    """雷达监控守护
+
+    监控退出后按指数退避重启; 超过 stall_seconds 秒没有收到任何行时标记为卡住并重启。
+    从停止输出到重新收到第一行记为一次中断, 记录重启次数和每次中断的时长。
+    """
+
+    def __init__(self, restart: Callable[[], Coroutine[Any, Any, Any]], on_change: Callable[[], None]):
+        self.hass: HomeAssistant | None = None
+        self.restart = restart
+        self.on_change = on_change
+        self.stall_seconds = DEFAULT_RADAR_STALL_SECONDS
+        self.backoff = MONITOR_RESTART_MIN_DELAY
+        self.last_line_at: float | None = None
+        self.outage_started_at: float | None = None
+        self.stalled = False
+        self.running = False
+        self._restart_cancel = None
+        self._stall_cancel = None
+        self.recent_outages: deque[float] = deque(maxlen=RECENT_OUTAGES)
+        self.stats = {
+            "restarts": 0,
+            "stalls": 0,
+            "outages": 0,
+            "last_outage_seconds": None,
+            "max_outage_seconds": 0.0,
+            "total_outage_seconds": 0.0,
+        }
+
+    @callback
+    def on_started(self):
+        """监控启动成功"""
+        self.last_line_at = time.monotonic()
+        self.running = True
+        self._arm_stall_check()
+
+    @callback
+    def set_stall_seconds(self, seconds: float):
+        """修改卡住判定时间, 监控运行中时立即开启或停止检测"""
+        self.stall_seconds = seconds
+        if seconds <= 0:
+            self._cancel_stall_check()
+        elif self.running and self._restart_cancel is None:
+            self._arm_stall_check()
+
+    @callback
+    def on_line(self):
+        """收到一行输出"""
+        now = time.monotonic()
+        self.last_line_at = now
+        self.backoff = MONITOR_RESTART_MIN_DELAY
+        if self.outage_started_at is None and not self.stalled:
+            return
+        if self.outage_started_at is not None:
+            self._end_outage(now)
+        self.stalled = False
+        self.on_change()
+
+    @callback
+    def on_down(self):
+        """监控意外退出或启动失败"""
+        self.running = False
+        self._cancel_stall_check()
+        self._begin_outage(time.monotonic())
+        self._schedule_restart()
+
+    @callback
+    def cancel(self):
+        """主动停止监控时取消重启和卡住检测"""
+        if self._restart_cancel is not None:
+            self._restart_cancel()
+            self._restart_cancel = None
+        self.running = False
+        self._cancel_stall_check()
+
+    def _arm_stall_check(self):
+        if self._stall_cancel is None and self.stall_seconds > 0:
+            self._stall_cancel = async_track_time_interval(self.hass, self._check_stall, timedelta(seconds=MONITOR_STALL_CHECK_SECONDS))
+
+    def _cancel_stall_check(self):
+        if self._stall_cancel is not None:
+            self._stall_cancel()
+            self._stall_cancel = None
+
+    @callback
+    def _check_stall(self, now=None):
+        if self.last_line_at is None or self.stall_seconds <= 0:
+            return
+        silent = time.monotonic() - self.last_line_at
+        if silent < self.stall_seconds:
+            return
+        if not self.stalled:
+            _LOGGER.warning(f"Radar monitor stalled, no output for {silent:.0f}s")
+            self.stalled = True
+            self.stats["stalls"] += 1
+            self._begin_outage(self.last_line_at)
+            self.on_change()
+        # 重启后仍然没有输出时继续按退避重启
+        self._cancel_stall_check()
+        self._schedule_restart()
+
+    def _begin_outage(self, started_at: float):
+        if self.outage_started_at is not None:
+            return
+        self.outage_started_at = started_at
+        self.stats["outages"] += 1
+
+    def _end_outage(self, now: float):
+        seconds = round(now - self.outage_started_at, 1)
+        self.outage_started_at = None
+        self.recent_outages.append(seconds)
+        stats = self.stats
+        stats["last_outage_seconds"] = seconds
+        stats["max_outage_seconds"] = max(stats["max_outage_seconds"], seconds)
+        stats["total_outage_seconds"] = round(stats["total_outage_seconds"] + seconds, 1)
+        _LOGGER.info(f"Radar monitor recovered after {seconds}s")
+
+    def _schedule_restart(self):
+        if self._restart_cancel is not None:
+            return
+        delay = self.backoff
+        self.backoff = min(self.backoff * 2, MONITOR_RESTART_MAX_DELAY)
+        _LOGGER.warning(f"Radar monitor down, restarting in {delay}s")
+        self._restart_cancel = async_call_later(self.hass, delay, self._fire_restart)
+
+    @callback
+    def _fire_restart(self, now=None):
+        self._restart_cancel = None
+        self.stats["restarts"] += 1
+        self.hass.async_create_task(self.restart())
+
+    def attributes(self) -> dict:
+        """实体属性, 只包含不随时间变化的统计"""
+        return {
+            **self.stats,
+            "stalled": self.stalled,
+        }
+
+    def as_dict(self) -> dict:
+        outage = None
+        if self.outage_started_at is not None:
+            outage = round(time.monotonic() - self.outage_started_at, 1)
+        silent = None
+        if self.last_line_at is not None:
+            silent = round(time.monotonic() - self.last_line_at, 1)
+        return {
+            **self.stats,
+            "stalled": self.stalled,
+            "stall_seconds": self.stall_seconds,
+            "current_outage_seconds": outage,
+            "seconds_since_last_line": silent,
+            "next_restart_delay": self.backoff,
+            "recent_outages": list(self.recent_outages),
+        }
@@ -0,0 +1,94 @@
+import base64
+import hashlib
+import json
+import zlib
+
+# 实体上报行: (区域名, 名称, entity_id)
+EntityRow = tuple[str, str, str]
+
+PAYLOAD_VERSION = 2
+FEATURE_COMPACT = "entities_v2"
+FEATURE_ZLIB = "zlib"
+COMPRESS_MIN_SIZE = 1024
+DIGEST_MODULUS = 1 << 256
+
+
+def format_legacy_row(row: EntityRow) -> str:
+    """旧格式的上报行 area,name,entity_id"""
+    area, name, entity_id = row
+    return f"{area},{name},{entity_id}"
+
+
+def hash_row(row: EntityRow) -> int:
+    """上报行的稳定哈希, 各行哈希按模相加即为整个集合的指纹, 与顺序无关"""
+    raw = json.dumps(list(row), ensure_ascii=False, separators=(",", ":")).encode()
+    return int.from_bytes(hashlib.sha256(raw).digest(), "big")
+
+
+def format_digest(value: int) -> str:
+    """指纹的十六进制表示"""
+    return f"{value % DIGEST_MODULUS:064x}"
+
+
+def build_area_table(rows: list[EntityRow]) -> tuple[list[str], list[list]]:
+    """区域名去重为区域表, 行中以下标引用区域"""
+    areas: list[str] = []
+    area_index: dict[str, int] = {}
+    indexed_rows: list[list] = []
+    for area, name, entity_id in rows:
+        index = area_index.get(area)
+        if index is None:
+            index = len(areas)
+            area_index[area] = index
+            areas.append(area)
+        indexed_rows.append([index, name, entity_id])
+    return areas, indexed_rows
+
+
+def encode_entities(rows: list[EntityRow], api_key: str, features: list[str]) -> dict:
+    """全量上报消息, 对端不支持 v2 时使用旧格式"""
+    if FEATURE_COMPACT not in features:
+        return {
+            "devices": ";".join(map(format_legacy_row, rows)),
+            "apiKey": api_key
+        }
+    areas, indexed_rows = build_area_table(rows)
+    body = {
+        "areas": areas,
+        "rows": indexed_rows,
+        "apiKey": api_key
+    }
+    return _wrap("entities", body, features)
+
+
+def encode_entity_changes(upserts: list[EntityRow], removes: list[str], api_key: str, features: list[str]) -> dict:
+    """增量上报消息, 对端不支持 v2 时使用旧格式"""
+    if FEATURE_COMPACT not in features:
+        return {
+            "action": "delta",
+            "upsert": ";".join(map(format_legacy_row, upserts)),
+            "remove": ";".join(removes),
+            "apiKey": api_key
+        }
+    areas, indexed_rows = build_area_table(upserts)
+    body = {
+        "areas": areas,
+        "upsert": indexed_rows,
+        "remove": removes,
+        "apiKey": api_key
+    }
+    return _wrap("delta", body, features)
+
+
+def _wrap(action: str, body: dict, features: list[str]) -> dict:
+    """加上版本号, 对端支持且数据足够大时进行 zlib 压缩"""
+    if FEATURE_ZLIB in features:
+        raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+        if len(raw) >= COMPRESS_MIN_SIZE:
+            return {
+                "action": action,
+                "version": PAYLOAD_VERSION,
+                "encoding": FEATURE_ZLIB,
+                "data": base64.b64encode(zlib.compress(raw, 6)).decode()
+            }
+    return {"action": action, "version": PAYLOAD_VERSION, **body}
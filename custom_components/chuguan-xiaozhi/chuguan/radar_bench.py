@@ -0,0 +1,65 @@
+"""雷达输出解析的微基准测试
+
+在集成目录下运行: python -m chuguan.radar_bench [-n 次数]
+"""
+import argparse
+import re
+import timeit
+from .radar_parser import parse_radar_line
+
+SAMPLE_LINES = [
+    "运动触发: 是 存在触发: 是 运动目标距离: 123 cm 存在目标距离: 98 cm",
+    "运动触发: 否 存在触发: 是 运动目标距离: 无 存在目标距离: 101 cm",
+    "运动触发: 否 存在触发: 否 运动目标距离: 无 存在目标距离: 无",
+    "继电器 = 1 0 1",
+    "radar_key poll started",
+]
+
+
+def legacy_parse_line(line: str) -> dict:
+    """改写前 RealDevice.parse_line 的解析逻辑, 仅用于对比"""
+    fields = {}
+    if "运动触发:" in line:
+        match = re.search(r'运动触发:\s*([是否])', line)
+        fields['motion_on'] = match is not None and match.group(1).strip() == '是'
+    if "存在触发:" in line:
+        match = re.search(r'存在触发:\s*([是否])', line)
+        fields['presence_on'] = match is not None and match.group(1).strip() == '是'
+    if "运动目标距离:" in line:
+        match = re.search(r'运动目标距离:\s*(\d+\s*cm|无)', line)
+        value = match.group(1).strip() if match else '无'
+        fields['motion_distance'] = None if value == '无' else int(value.replace('cm', ''))
+    if "存在目标距离:" in line:
+        match = re.search(r'存在目标距离:\s*(\d+\s*cm|无)', line)
+        value = match.group(1).strip() if match else '无'
+        fields['presence_distance'] = None if value == '无' else int(value.replace('cm', ''))
+    if "继电器" in line:
+        match = re.search(r'继电器\s*=\s*(.+)', line)
+        if match:
+            items = match.group(1).strip().split(' ')
+            fields['relays'] = (items[0] == '1', items[1] == '1', items[2] == '1')
+    return fields
+
+
+def bench(func, number: int) -> float:
+    """返回每行平均耗时(微秒)"""
+    def run():
+        for line in SAMPLE_LINES:
+            func(line)
+    seconds = min(timeit.repeat(run, number=number, repeat=5))
+    return seconds / (number * len(SAMPLE_LINES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="radar line parser microbenchmark")
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+    legacy = bench(legacy_parse_line, args.number)
+    current = bench(parse_radar_line, args.number)
+    print(f"legacy parse_line:  {legacy:.2f} us/line")
+    print(f"parse_radar_line:   {current:.2f} us/line")
+    print(f"speedup:            {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
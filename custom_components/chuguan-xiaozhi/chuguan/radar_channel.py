@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import time
+from .utils import async_execute_shell
+from .const import RADAR_COMMAND_TIMEOUT
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RadarCommandChannel:
+    """radar_key 命令队列
+
+    所有命令经过同一个队列按顺序执行, 不会有多个 radar_key 同时访问扩展板。
+    radar_key 目前没有常驻的命令模式, --poll 进程也不读取命令, 所以每条命令仍然启动一次 radar_key;
+    超时或被取消时结束该进程。
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "commands": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "last_ms": 0.0,
+            "max_ms": 0.0,
+        }
+
+    async def command(self, args: list[str], timeout: float = RADAR_COMMAND_TIMEOUT) -> str | None:
+        """排队执行一条命令, 返回输出, 失败时返回 None"""
+        async with self._lock:
+            start = time.monotonic()
+            try:
+                # 超时取消时 async_execute_shell 会结束子进程
+                async with asyncio.timeout(timeout):
+                    result = await async_execute_shell(["radar_key", *args])
+            except TimeoutError:
+                _LOGGER.error(f"radar_key command {' '.join(args)} timed out after {timeout}s")
+                self.stats["timeouts"] += 1
+                result = None
+            elapsed = round((time.monotonic() - start) * 1000, 1)
+            stats = self.stats
+            stats["commands"] += 1
+            stats["last_ms"] = elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+            if result is None:
+                stats["errors"] += 1
+            return result
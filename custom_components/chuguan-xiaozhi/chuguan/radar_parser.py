@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+import re
+
+# --poll 输出的完整状态行, 整行匹配时一次取出全部四个字段, 其他行(如 --status --query-relay 的多行输出)逐字段扫描
+_STATUS_RE = re.compile(
+    r'运动触发:\s*([是否])\s*存在触发:\s*([是否])\s*'
+    r'运动目标距离:\s*(?:(\d+)\s*cm|无)\s*存在目标距离:\s*(?:(\d+)\s*cm|无)'
+)
+
+# 其他形式的行: 一次扫描取出行中出现的所有字段
+_FIELD_RE = re.compile(
+    r'(?P<label>运动触发|存在触发|运动目标距离|存在目标距离):\s*(?:(?P<flag>[是否])|(?P<cm>\d+)\s*cm)?'
+    r'|继电器\s*=\s*(?P<r1>\S+)\s+(?P<r2>\S+)\s+(?P<r3>\S+)'
+)
+
+
+@dataclass(slots=True)
+class RadarReading:
+    """一行 radar_key 输出解析出的字段, 行中没有出现的字段为 None
+
+    距离为 None 时可能是没有出现, 也可能是 "无", 由 has_*_distance 区分。
+    """
+
+    motion_on: bool | None = None
+    presence_on: bool | None = None
+    motion_distance: int | None = None
+    presence_distance: int | None = None
+    has_motion_distance: bool = False
+    has_presence_distance: bool = False
+    relays: tuple[bool, bool, bool] | None = None
+
+
+def parse_radar_line(line: str) -> RadarReading | None:
+    """解析一行雷达输出, 没有任何字段时返回 None"""
+    match = _STATUS_RE.fullmatch(line)
+    if match is not None:
+        motion_on, presence_on, motion_cm, presence_cm = match.groups()
+        return RadarReading(
+            motion_on=motion_on == '是',
+            presence_on=presence_on == '是',
+            motion_distance=int(motion_cm) if motion_cm is not None else None,
+            presence_distance=int(presence_cm) if presence_cm is not None else None,
+            has_motion_distance=True,
+            has_presence_distance=True,
+        )
+    reading = None
+    for match in _FIELD_RE.finditer(line):
+        if reading is None:
+            reading = RadarReading()
+        label = match.group('label')
+        if label is None:
+            reading.relays = (match.group('r1') == '1', match.group('r2') == '1', match.group('r3') == '1')
+        elif label == '运动触发':
+            reading.motion_on = match.group('flag') == '是'
+        elif label == '存在触发':
+            reading.presence_on = match.group('flag') == '是'
+        else:
+            cm = match.group('cm')
+            distance = int(cm) if cm is not None else None
+            if label == '运动目标距离':
+                reading.motion_distance = distance
+                reading.has_motion_distance = True
+            else:
+                reading.presence_distance = distance
+                reading.has_presence_distance = True
+    return reading
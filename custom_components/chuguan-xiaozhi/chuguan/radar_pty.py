@@ -0,0 +1,155 @@
+"""用 pty 模拟扩展板, 用于在没有硬件时测试串口后端
+
+在集成目录下运行: python -m chuguan.radar_pty
+会打印模拟串口的路径。串口后端暂不在选项表单中提供, 需要在配置项的选项中写入
+radar_backend: serial 和 radar_serial_port: <该路径>。
+应答格式见 radar_serial: 命令行以序号开头, 应答行以 ">序号 " 开头, 主动上报的行不带前缀。
+"""
+import argparse
+import asyncio
+import os
+import random
+import tty
+
+PARAM_FLAGS = ("--move-min", "--move-max", "--move-sens", "--exist-min", "--exist-max", "--exist-sens", "--period")
+
+
+def format_status(motion_on: bool, presence_on: bool, motion_distance: int | None, presence_distance: int | None) -> str:
+    """radar_key --poll 格式的状态行"""
+    def distance(value):
+        return "无" if value is None else f"{value} cm"
+    return (
+        f"运动触发: {'是' if motion_on else '否'} 存在触发: {'是' if presence_on else '否'} "
+        f"运动目标距离: {distance(motion_distance)} 存在目标距离: {distance(presence_distance)}"
+    )
+
+
+class FakeRadarBoard:
+    """pty 另一端的模拟扩展板"""
+
+    def __init__(self):
+        self.path: str | None = None
+        self.relays = [False, False, False]
+        self.led: list[int] = []
+        self.params: dict[str, int] = {}
+        self.status = (False, False, None, None)
+        self.commands: list[list[str]] = []
+        # 为 True 时暂存应答, 用于测试超时和迟到的应答
+        self.hold_replies = False
+        self.held: list[str] = []
+        self._master: int | None = None
+        self._slave: int | None = None
+        self._buffer = b""
+
+    def open(self) -> str:
+        """创建 pty, 返回串口路径"""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        os.set_blocking(self._master, False)
+        self.path = os.ttyname(self._slave)
+        asyncio.get_running_loop().add_reader(self._master, self._on_readable)
+        return self.path
+
+    def close(self):
+        if self._master is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._master)
+        os.close(self._master)
+        os.close(self._slave)
+        self._master = None
+        self._slave = None
+
+    def report(self, motion_on: bool, presence_on: bool, motion_distance: int | None, presence_distance: int | None):
+        """主动上报一行状态"""
+        self.status = (motion_on, presence_on, motion_distance, presence_distance)
+        self._send(format_status(*self.status))
+
+    def release(self):
+        """发出暂存的应答"""
+        held, self.held = self.held, []
+        if held:
+            self._send(*held)
+
+    def _relay_line(self) -> str:
+        return "继电器 = " + " ".join("1" if on else "0" for on in self.relays)
+
+    def _send(self, *lines: str):
+        os.write(self._master, "".join(line + "\n" for line in lines).encode())
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            seq, *args = line.decode().split() or [""]
+            if not args:
+                continue
+            self.commands.append(args)
+            replies = [f">{seq} {reply}" for reply in self.handle(args)]
+            if self.hold_replies:
+                self.held.extend(replies)
+            else:
+                self._send(*replies)
+
+    def handle(self, args: list[str]) -> list[str]:
+        """处理一条命令, 返回应答行"""
+        flag = args[0]
+        try:
+            if flag == "--status":
+                lines = [format_status(*self.status)]
+                if "--query-relay" in args:
+                    lines.append(self._relay_line())
+                return [*lines, "OK"]
+            if flag == "--relay":
+                self.relays[int(args[1])] = args[2] == "1"
+                return [self._relay_line(), "OK"]
+            if flag == "--led":
+                values = [int(value) for value in args[1:]]
+                if len(values) != 20:
+                    return [f"ERR led expects 20 values, got {len(values)}"]
+                self.led = values
+                return ["OK"]
+            if flag in PARAM_FLAGS:
+                for name, value in zip(args[::2], args[1::2]):
+                    if name not in PARAM_FLAGS:
+                        return [f"ERR unknown option {name}"]
+                    self.params[name] = int(value)
+                return ["OK"]
+        except (IndexError, ValueError) as e:
+            return [f"ERR {e}"]
+        return [f"ERR unknown command {flag}"]
+
+
+async def serve(interval: float):
+    board = FakeRadarBoard()
+    print(board.open(), flush=True)
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            presence_on = random.random() < 0.7
+            motion_on = presence_on and random.random() < 0.5
+            board.report(
+                motion_on,
+                presence_on,
+                random.randint(50, 300) if motion_on else None,
+                random.randint(50, 300) if presence_on else None,
+            )
+    finally:
+        board.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pty stand-in for the radar/key board")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="seconds between status reports")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
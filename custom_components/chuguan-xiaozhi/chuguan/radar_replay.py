@@ -0,0 +1,240 @@
+"""雷达输出的录制、回放和吞吐基准
+
+在集成目录下运行:
+  python -m chuguan.radar_replay record -o radar.tsv [--seconds 600]   录制 radar_key --poll 的原始输出
+  radar_key --poll 0 | python -m chuguan.radar_replay record -o radar.tsv --stdin
+  python -m chuguan.radar_replay replay radar.tsv [--speed 1 | --fast]  按原速度或尽快回放
+  python -m chuguan.radar_replay bench [radar.tsv] [-n 20000]           尽快回放并输出吞吐和 line_to_state 延迟
+
+录制文件每行为 "<相对秒数>\\t<原始行>"。回放把每一行交给 realDevice.parse_line, 时钟由录制的相对秒数驱动;
+运动、存在和两个距离实体挂在回放用的 hass 上, 从行进入 parse_line 到实体写入状态(state_changed 事件)
+的时间记为 line_to_state 延迟, 包含实体属性中的窗口统计。
+回放和基准需要安装 Home Assistant 和集成的依赖。
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+POLL_COMMAND = ["stdbuf", "-oL", "radar_key", "--poll", "0"]
+
+
+def format_record(offset: float, line: str) -> str:
+    return f"{offset:.3f}\t{line}\n"
+
+
+def read_records(path: str) -> list[tuple[float, str]]:
+    """读取录制文件, 返回 (相对秒数, 行)"""
+    records = []
+    with open(path, encoding="utf-8") as file:
+        for raw in file:
+            offset, sep, line = raw.rstrip("\n").partition("\t")
+            if sep:
+                records.append((float(offset), line))
+    return records
+
+
+def record(output: str, seconds: float | None, use_stdin: bool):
+    """录制原始行, 直到超时、输入结束或 Ctrl-C"""
+    process = None
+    if use_stdin:
+        source = sys.stdin
+    else:
+        process = subprocess.Popen(POLL_COMMAND, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+        source = process.stdout
+    start = time.monotonic()
+    count = 0
+    try:
+        with open(output, "w", encoding="utf-8") as file:
+            for raw in source:
+                offset = time.monotonic() - start
+                line = raw.strip()
+                if line:
+                    file.write(format_record(offset, line))
+                    file.flush()
+                    count += 1
+                if seconds is not None and offset >= seconds:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(f"recorded {count} lines to {output}", file=sys.stderr)
+
+
+def synthetic_records(count: int, seed: int = 0, interval: float = 0.1) -> list[tuple[float, str]]:
+    """生成类似真实输出的状态行: 有人进出、距离随机游走, 偶尔夹带继电器行"""
+    from .radar_pty import format_status
+    rng = random.Random(seed)
+    records = []
+    presence_on = False
+    motion_distance = presence_distance = 150
+    for index in range(count):
+        if rng.random() < 0.01:
+            presence_on = not presence_on
+        motion_on = presence_on and rng.random() < 0.4
+        motion_distance = min(max(motion_distance + rng.randint(-8, 8), 30), 500)
+        presence_distance = min(max(presence_distance + rng.randint(-4, 4), 30), 500)
+        line = format_status(
+            motion_on,
+            presence_on,
+            motion_distance if motion_on else None,
+            presence_distance if presence_on else None,
+        )
+        if rng.random() < 0.005:
+            line = "继电器 = " + " ".join(rng.choice("01") for _ in range(3))
+        records.append((index * interval, line))
+    return records
+
+
+def load_sensors():
+    """以集成包的方式导入实体模块, 实体和回放使用同一个 realDevice"""
+    integration_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if os.path.dirname(integration_dir) not in sys.path:
+        sys.path.insert(0, os.path.dirname(integration_dir))
+    return importlib.import_module(f"{os.path.basename(integration_dir)}.SensorDevice")
+
+
+def flush_due(device, now: float) -> bool:
+    """补发到期的暂存距离, 代替回放时不会按录制时间触发的 async_call_later"""
+    flushed = False
+    for key, distance_filter in device.distance_filters.items():
+        if distance_filter.has_pending and distance_filter.next_publish_at <= now:
+            cancel = device._distance_flush_cancels.pop(key, None)
+            if cancel is not None:
+                cancel()
+            device._flush_distance(key)
+            flushed = True
+    return flushed
+
+
+async def replay(records: list[tuple[float, str]], speed: float | None) -> dict:
+    """回放到 realDevice 和雷达实体, speed 为 None 时尽快回放"""
+    from homeassistant.const import EVENT_STATE_CHANGED
+    from homeassistant.core import HomeAssistant, callback
+
+    sensors = load_sensors()
+    device = sensors.realDevice
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            device.hass = hass
+            device.supervisor.hass = hass
+            clock = 0.0
+            device.clock = lambda: clock
+            entities = [
+                ("binary_sensor", sensors.MotionBinarySensor()),
+                ("binary_sensor", sensors.PresenceBinarySensor()),
+                *(("sensor", sensor) for sensor in sensors.getAllSensor()),
+            ]
+            for domain, entity in entities:
+                entity.hass = hass
+                entity.entity_id = f"{domain}.replay_{entity.unique_id}"
+                await entity.async_added_to_hass()
+            await hass.async_block_till_done()
+            entity_ids = {entity.entity_id for _, entity in entities}
+            events = 0
+            flushed_events = 0
+            latencies: list[float] = []
+            line_started: float | None = None
+
+            @callback
+            def on_state_changed(event):
+                nonlocal events, flushed_events
+                if event.data["entity_id"] not in entity_ids:
+                    return
+                events += 1
+                if line_started is None:
+                    flushed_events += 1
+                else:
+                    latencies.append(time.perf_counter() - line_started)
+
+            cancel = hass.bus.async_listen(EVENT_STATE_CHANGED, on_state_changed)
+            start = time.perf_counter()
+            for offset, line in records:
+                if speed is not None:
+                    delay = start + offset / speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                clock = offset
+                line_started = None
+                if flush_due(device, clock):
+                    await hass.async_block_till_done()
+                line_started = time.perf_counter()
+                await device.parse_line(line)
+                # 让排队的 state_changed 监听在下一行之前执行
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - start
+            # 结束前补发所有暂存的距离, 最终状态与实时运行一致
+            line_started = None
+            pending = [f.next_publish_at for f in device.distance_filters.values() if f.has_pending]
+            if pending:
+                clock = max(clock, *pending)
+                flush_due(device, clock)
+            await hass.async_block_till_done()
+            cancel()
+        finally:
+            await hass.async_stop(force=True)
+
+    lines = len(records)
+    result = {
+        "lines": lines,
+        "seconds": round(elapsed, 3),
+        "lines_per_second": round(lines / elapsed) if elapsed > 0 else None,
+        "events": events,
+        "flushed_events": flushed_events,
+        "events_per_line": round(events / lines, 3) if lines else None,
+    }
+    if latencies:
+        latencies.sort()
+        result["line_to_state_us"] = {
+            "mean": round(statistics.fmean(latencies) * 1e6, 1),
+            "p50": round(latencies[len(latencies) // 2] * 1e6, 1),
+            "p99": round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1e6, 1),
+            "max": round(latencies[-1] * 1e6, 1),
+        }
+    return result
+
+
+def print_result(result: dict):
+    for key, value in result.items():
+        print(f"{key + ':':<20} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record, replay and benchmark radar_key output")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="record radar_key --poll lines with timestamps")
+    record_parser.add_argument("-o", "--output", required=True)
+    record_parser.add_argument("--seconds", type=float, default=None)
+    record_parser.add_argument("--stdin", action="store_true", help="read lines from stdin instead of running radar_key")
+    replay_parser = commands.add_parser("replay", help="replay a recording through RealDevice")
+    replay_parser.add_argument("file")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="playback speed factor")
+    replay_parser.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    bench_parser = commands.add_parser("bench", help="replay as fast as possible and report throughput")
+    bench_parser.add_argument("file", nargs="?", help="recording, synthetic lines when omitted")
+    bench_parser.add_argument("-n", "--number", type=int, default=20000, help="synthetic line count")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.output, args.seconds, args.stdin)
+        return
+    if args.command == "replay":
+        records = read_records(args.file)
+        print_result(asyncio.run(replay(records, None if args.fast else args.speed)))
+        return
+    records = read_records(args.file) if args.file else synthetic_records(args.number)
+    print_result(asyncio.run(replay(records, None)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""扩展板串口直连
+
+注意: 目前的扩展板固件没有实现这里的协议, 需要配合实现了该协议的固件或桥接程序使用。
+扩展板固件的串口协议不在本仓库中, 这里使用与 radar_key 命令行对应的文本行协议:
+每条命令是一行 "<序号> <radar_key 参数>" (例如 "7 --relay 0 1"), 应答的每一行以 ">序号 " 开头,
+内容与 radar_key 的输出相同, 最后一行为 ">序号 OK" 或 ">序号 ERR <原因>";
+不带 ">" 前缀的行都是扩展板主动上报的状态, 格式与 radar_key --poll 的输出相同, 命令执行期间也照常上报。
+序号不匹配的应答(例如超时命令迟到的应答)直接丢弃。
+"""
+import asyncio
+import logging
+import os
+import termios
+import tty
+from collections.abc import Callable
+from .const import DEFAULT_RADAR_SERIAL_BAUDRATE, RADAR_COMMAND_TIMEOUT
+
+_LOGGER = logging.getLogger(__name__)
+
+READ_SIZE = 4096
+MAX_LINE_LENGTH = 4096
+
+
+class SerialCommandError(Exception):
+    """扩展板返回 ERR"""
+
+
+def open_serial(path: str, baudrate: int) -> int:
+    """以原始模式打开串口, 返回非阻塞的文件描述符"""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        speed = getattr(termios, f"B{baudrate}")
+        attrs = termios.tcgetattr(fd)
+        attrs[4] = speed
+        attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+class SerialRadarLink:
+    """串口连接, 主动上报的行交给 on_line, 命令按顺序发送并等待应答"""
+
+    def __init__(self, path: str, baudrate: int = DEFAULT_RADAR_SERIAL_BAUDRATE, on_line: Callable[[str], None] | None = None):
+        self.path = path
+        self.baudrate = baudrate
+        self.on_line = on_line
+        self._fd: int | None = None
+        self._buffer = b""
+        self._lock = asyncio.Lock()
+        self._response: list[str] | None = None
+        self._seq = 0
+        self._response_future: asyncio.Future | None = None
+        self._closed: asyncio.Future | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd is not None
+
+    async def open(self):
+        """打开串口并开始读取"""
+        loop = asyncio.get_running_loop()
+        self._fd = await loop.run_in_executor(None, open_serial, self.path, self.baudrate)
+        self._buffer = b""
+        self._closed = loop.create_future()
+        loop.add_reader(self._fd, self._on_readable)
+        _LOGGER.info(f"Radar serial {self.path} opened at {self.baudrate}")
+
+    def close(self, exc: Exception | None = None):
+        """关闭串口, 在途命令以异常结束"""
+        if self._fd is None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._fd)
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+        self._fd = None
+        self._finish_response(exc=exc or ConnectionError("radar serial closed"))
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(exc)
+
+    async def wait_closed(self) -> Exception | None:
+        """等待连接关闭, 返回导致关闭的异常"""
+        if self._closed is None:
+            return None
+        return await asyncio.shield(self._closed)
+
+    async def command(self, args: list[str], timeout: float = RADAR_COMMAND_TIMEOUT) -> str:
+        """发送一条命令, 返回应答行(不含结束行)"""
+        async with self._lock:
+            if self._fd is None:
+                raise ConnectionError("radar serial not open")
+            loop = asyncio.get_running_loop()
+            self._seq = self._seq % 65535 + 1
+            self._response = []
+            self._response_future = loop.create_future()
+            future = self._response_future
+            try:
+                await self._write((" ".join([str(self._seq), *args]) + "\n").encode())
+                async with asyncio.timeout(timeout):
+                    return await future
+            finally:
+                if self._response_future is future:
+                    self._response = None
+                    self._response_future = None
+
+    async def _write(self, data: bytes):
+        loop = asyncio.get_running_loop()
+        while data:
+            try:
+                written = os.write(self._fd, data)
+                data = data[written:]
+            except BlockingIOError:
+                ready = loop.create_future()
+                loop.add_writer(self._fd, ready.set_result, None)
+                try:
+                    await ready
+                finally:
+                    if self._fd is not None:
+                        loop.remove_writer(self._fd)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            _LOGGER.error(f"Radar serial {self.path} read error: {e}")
+            self.close(e)
+            return
+        if not data:
+            self.close()
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > MAX_LINE_LENGTH:
+            _LOGGER.warning(f"Radar serial {self.path} dropped {len(self._buffer)} bytes without newline")
+            self._buffer = b""
+        for raw_line in lines:
+            line = raw_line.decode("utf-8", errors="replace").strip()
+            if line:
+                self._handle_line(line)
+
+    def _handle_line(self, line: str):
+        if not line.startswith(">"):
+            if self.on_line is not None:
+                self.on_line(line)
+            return
+        seq, _, content = line[1:].partition(" ")
+        if self._response is None or seq != str(self._seq):
+            _LOGGER.debug(f"Radar serial {self.path} dropped stale reply: {line}")
+            return
+        content = content.strip()
+        if content == "OK":
+            self._finish_response(result="\n".join(self._response))
+        elif content.startswith("ERR"):
+            self._finish_response(exc=SerialCommandError(content[3:].strip()))
+        elif content:
+            self._response.append(content)
+
+    def _finish_response(self, result: str | None = None, exc: Exception | None = None):
+        future = self._response_future
+        self._response = None
+        self._response_future = None
+        if future is None or future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
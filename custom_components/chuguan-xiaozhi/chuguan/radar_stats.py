@@ -0,0 +1,106 @@
+from array import array
+from .const import RADAR_STATS_CAPACITY, RADAR_STATS_SPACING, RADAR_STATS_WINDOWS, RADAR_STATS_BIN_CM, RADAR_STATS_BINS
+
+MOTION_FLAG = 1
+PRESENCE_FLAG = 2
+NO_DISTANCE = -1
+MAX_DISTANCE = 32767
+
+
+class RadarStats:
+    """最近雷达读数的环形缓冲区和按时间窗口的统计
+
+    读数保存在定长 array 中, 内存占用固定: 每条 8 字节时间 + 1 字节标志 + 2×2 字节距离。
+    标志不变时最多每 spacing 秒记录一条, 占用率按时间加权计算。
+    """
+
+    def __init__(self, capacity: int = RADAR_STATS_CAPACITY, spacing: float = RADAR_STATS_SPACING):
+        self.capacity = capacity
+        self.spacing = spacing
+        self.times = array('d', [0.0]) * capacity
+        self.flags = array('B', [0]) * capacity
+        self.motion_distances = array('h', [NO_DISTANCE]) * capacity
+        self.presence_distances = array('h', [NO_DISTANCE]) * capacity
+        self.head = 0
+        self.size = 0
+        self.total = 0
+
+    def add(self, now: float, motion_on: bool, presence_on: bool, motion_distance: int | None, presence_distance: int | None):
+        """记录一次读数"""
+        flags = (MOTION_FLAG if motion_on else 0) | (PRESENCE_FLAG if presence_on else 0)
+        if self.size:
+            last = (self.head - 1) % self.capacity
+            if self.flags[last] == flags and now - self.times[last] < self.spacing:
+                return
+        index = self.head
+        self.times[index] = now
+        self.flags[index] = flags
+        self.motion_distances[index] = NO_DISTANCE if motion_distance is None else min(motion_distance, MAX_DISTANCE)
+        self.presence_distances[index] = NO_DISTANCE if presence_distance is None else min(presence_distance, MAX_DISTANCE)
+        self.head = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def _indices(self):
+        """从旧到新的下标"""
+        start = (self.head - self.size) % self.capacity
+        for offset in range(self.size):
+            yield (start + offset) % self.capacity
+
+    def summary(self, window: float, now: float) -> dict:
+        """window 秒内的统计: 占用率、运动触发次数/分钟和距离直方图"""
+        since = now - window
+        samples = 0
+        covered = 0.0
+        occupied = 0.0
+        triggers = 0
+        motion_histogram = [0] * RADAR_STATS_BINS
+        presence_histogram = [0] * RADAR_STATS_BINS
+        previous = None
+        for index in self._indices():
+            at = self.times[index]
+            if previous is not None:
+                # 上一条读数一直持续到这一条
+                prev_at, prev_flags = previous
+                start = max(prev_at, since)
+                if at > start:
+                    covered += at - start
+                    if prev_flags & PRESENCE_FLAG:
+                        occupied += at - start
+            flags = self.flags[index]
+            previous = (at, flags)
+            if at < since:
+                continue
+            samples += 1
+            if flags & MOTION_FLAG and (index == (self.head - self.size) % self.capacity or not self.flags[index - 1] & MOTION_FLAG):
+                triggers += 1
+            distance = self.motion_distances[index]
+            if distance != NO_DISTANCE:
+                motion_histogram[min(distance // RADAR_STATS_BIN_CM, RADAR_STATS_BINS - 1)] += 1
+            distance = self.presence_distances[index]
+            if distance != NO_DISTANCE:
+                presence_histogram[min(distance // RADAR_STATS_BIN_CM, RADAR_STATS_BINS - 1)] += 1
+        if previous is not None:
+            start = max(previous[0], since)
+            if now > start:
+                covered += now - start
+                if previous[1] & PRESENCE_FLAG:
+                    occupied += now - start
+        return {
+            "samples": samples,
+            "covered_seconds": round(covered, 1),
+            "occupancy_ratio": round(occupied / covered, 3) if covered > 0 else None,
+            "motion_triggers": triggers,
+            "trigger_rate_per_minute": round(triggers * 60 / covered, 2) if covered > 0 else None,
+            "motion_histogram": motion_histogram,
+            "presence_histogram": presence_histogram,
+        }
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "capacity": self.capacity,
+            "size": self.size,
+            "total": self.total,
+            "bin_cm": RADAR_STATS_BIN_CM,
+            "windows": {f"{window}s": self.summary(window, now) for window in RADAR_STATS_WINDOWS},
+        }
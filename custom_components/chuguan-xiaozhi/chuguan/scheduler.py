@@ -0,0 +1,111 @@
+from collections.abc import Callable, Coroutine
+from typing import Any
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CoalescingScheduler:
+    """合并短时间内的多次触发
+
+    最后一次触发后静默 quiet 秒执行一次; 持续有触发时, 从第一次触发起最多等待 max_wait 秒。
+    """
+
+    def __init__(self, hass: HomeAssistant, name: str, action: Callable[[], Coroutine[Any, Any, Any]], quiet: float, max_wait: float):
+        self.hass = hass
+        self.name = name
+        self.action = action
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self._cancel = None
+        self._first_at: float | None = None
+        self._events = 0
+        self.stats = {
+            "runs": 0,
+            "events": 0,
+            "last_events": 0,
+            "max_events": 0,
+            "last_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+    @callback
+    def trigger(self):
+        """记录一次触发并重新计算执行时间"""
+        now = time.monotonic()
+        if self._first_at is None:
+            self._first_at = now
+        self._events += 1
+        delay = min(self.quiet, self._first_at + self.max_wait - now)
+        if self._cancel is not None:
+            self._cancel()
+        self._cancel = async_call_later(self.hass, max(delay, 0), self._fire)
+
+    @callback
+    def _fire(self, now=None):
+        self._cancel = None
+        events = self._events
+        wait = time.monotonic() - self._first_at if self._first_at is not None else 0.0
+        self._events = 0
+        self._first_at = None
+        stats = self.stats
+        stats["runs"] += 1
+        stats["events"] += events
+        stats["last_events"] = events
+        stats["max_events"] = max(stats["max_events"], events)
+        stats["last_wait"] = round(wait, 3)
+        stats["max_wait"] = max(stats["max_wait"], stats["last_wait"])
+        _LOGGER.debug(f"{self.name} run after {wait:.2f}s, coalesced {events} events")
+        self.hass.async_create_task(self.action())
+
+    def cancel(self):
+        """取消尚未执行的调度"""
+        if self._cancel is not None:
+            self._cancel()
+            self._cancel = None
+        self._events = 0
+        self._first_at = None
+
+
+class SingleFlight:
+    """同一时间只允许一次执行
+
+    执行期间的再次调用只标记为脏, 当前执行结束后再补充执行一次; full 标记会合并到补充执行中。
+    """
+
+    def __init__(self, name: str, action: Callable[[bool], Coroutine[Any, Any, Any]]):
+        self.name = name
+        self.action = action
+        self.is_running = False
+        self._dirty = False
+        self._full = False
+        self.stats = {
+            "runs": 0,
+            "coalesced": 0,
+        }
+
+    async def run(self, full: bool = False):
+        """执行, 已在执行中时只标记为脏"""
+        self._full = self._full or full
+        if self.is_running:
+            self._dirty = True
+            self.stats["coalesced"] += 1
+            return
+        self.is_running = True
+        try:
+            while True:
+                self._dirty = False
+                full = self._full
+                self._full = False
+                self.stats["runs"] += 1
+                try:
+                    await self.action(full)
+                except Exception as e:
+                    _LOGGER.error(f"{self.name} failed: {e}")
+                if not self._dirty:
+                    break
+        finally:
+            self.is_running = False
@@ -1,102 +1,267 @@
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from .utils import get_main_mac
 from homeassistant.helpers.storage import Store
-from .const import DOMAIN, STORAGE_VERSION
-from datetime import datetime, timedelta
+from .const import DOMAIN, STORAGE_VERSION, STORAGE_SAVE_DELAY, STORAGE_OVER_BUDGET_SAVE_DELAY, DEFAULT_WRITE_BUDGET_KIB
+from datetime import date, datetime, timedelta
+import asyncio
+import json
+
+# 经常修改的设置(雷达参数、按键背光)单独保存在一个小文件中
+HOT_KEY_PREFIXES = ("kv_", "way_")
+
+
+COLD_KEYS = ("api_key", "devices_digest", "devices", "host", "install_version")
+
+
+def is_hot_key(key: str) -> bool:
+    return key.startswith(HOT_KEY_PREFIXES)
+
+
+def key_group(key: str) -> str:
+    """统计用的键分组, 以用户 id 为键的 token 记录归为 token"""
+    for prefix in HOT_KEY_PREFIXES:
+        if key.startswith(prefix):
+            return prefix
+    if key in COLD_KEYS:
+        return key
+    return "token"
+
+
+class StorageStats:
+    """存储写入统计和每日写入预算, 超出预算后延长保存延迟"""
+
+    def __init__(self, budget_bytes: int = DEFAULT_WRITE_BUDGET_KIB * 1024):
+        self.budget_bytes = budget_bytes
+        self.saves = 0
+        self.bytes_written = 0
+        self.saves_by_group: dict[str, int] = {}
+        self.bytes_by_file: dict[str, int] = {}
+        self.day = date.today()
+        self.day_saves = 0
+        self.day_bytes = 0
+        self.over_budget_days = 0
+
+    def _roll_day(self):
+        today = date.today()
+        if today == self.day:
+            return
+        self.day = today
+        self.day_saves = 0
+        self.day_bytes = 0
+
+    def record(self, file_key: str, keys: set[str], size: int):
+        """记录一次保存"""
+        self._roll_day()
+        was_over_budget = self.is_over_budget
+        self.saves += 1
+        self.bytes_written += size
+        self.day_saves += 1
+        self.day_bytes += size
+        self.bytes_by_file[file_key] = self.bytes_by_file.get(file_key, 0) + size
+        for group in {key_group(key) for key in keys}:
+            self.saves_by_group[group] = self.saves_by_group.get(group, 0) + 1
+        if not was_over_budget and self.is_over_budget:
+            self.over_budget_days += 1
+
+    @property
+    def is_over_budget(self) -> bool:
+        self._roll_day()
+        return self.budget_bytes > 0 and self.day_bytes >= self.budget_bytes
+
+    @property
+    def save_delay(self) -> int:
+        if self.is_over_budget:
+            return STORAGE_OVER_BUDGET_SAVE_DELAY
+        return STORAGE_SAVE_DELAY
+
+    def as_dict(self) -> dict:
+        self._roll_day()
+        return {
+            "saves": self.saves,
+            "bytes_written": self.bytes_written,
+            "saves_by_group": dict(self.saves_by_group),
+            "bytes_by_file": dict(self.bytes_by_file),
+            "day": self.day.isoformat(),
+            "day_saves": self.day_saves,
+            "day_bytes": self.day_bytes,
+            "budget_bytes": self.budget_bytes,
+            "is_over_budget": self.is_over_budget,
+            "over_budget_days": self.over_budget_days,
+            "save_delay": self.save_delay,
+        }
+
+
+class StoreFile:
+    """单个存储文件的内存缓存, 修改后延迟合并保存"""
+
+    def __init__(self, hass: HomeAssistant, key: str, stats: StorageStats):
+        self.key = key
+        self.store = Store(hass, STORAGE_VERSION, key)
+        self.stats = stats
+        self.data: dict = {}
+        self.dirty = False
+        self.pending_keys: set[str] = set()
+
+    @callback
+    def schedule_save(self, *keys: str):
+        self.dirty = True
+        self.pending_keys.update(keys)
+        self.store.async_delay_save(self._data_to_save, self.stats.save_delay)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        self.dirty = False
+        data = dict(self.data)
+        # 按 Store 的写入格式估算写入字节数
+        size = len(json.dumps({"version": STORAGE_VERSION, "key": self.key, "data": data}, ensure_ascii=False, indent=2).encode())
+        self.stats.record(self.key, self.pending_keys, size)
+        self.pending_keys = set()
+        return data
+
+    async def async_flush(self):
+        """Save pending changes now"""
+        if not self.dirty:
+            return
+        await self.store.async_save(self._data_to_save())
+
 
 class MyStore:
-    """Chuguan Xiaozhi Store"""
+    """Chuguan Xiaozhi Store
+
+    第一次访问时加载一次, 之后读取都来自内存; 写入只修改内存并延迟 STORAGE_SAVE_DELAY 秒合并保存,
+    HA 退出时由 Store 自动落盘, 也可以调用 async_flush 立即保存。
+    身份和同步数据保存在 chuguan-xiaozhi.<mac>, 经常修改的设置保存在 chuguan-xiaozhi.<mac>.settings,
+    每次写入只会重写发生变化的那个文件。
+    """
 
     def __init__(self, hass: HomeAssistant):
         self.hass = hass
         self.mac = get_main_mac()
-        self.store = Store(hass, STORAGE_VERSION, f"chuguan-xiaozhi.{self.mac}")
+        self.stats = StorageStats()
+        self.cold = StoreFile(hass, f"chuguan-xiaozhi.{self.mac}", self.stats)
+        self.hot = StoreFile(hass, f"chuguan-xiaozhi.{self.mac}.settings", self.stats)
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def async_load(self):
+        """Load both store files once, migrating settings out of the old single file"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            cold_data = await self.cold.store.async_load()
+            if isinstance(cold_data, dict) == False:
+                cold_data = {}
+            hot_data = await self.hot.store.async_load()
+            hot_exists = isinstance(hot_data, dict)
+            if not hot_exists:
+                hot_data = {}
+            hot_keys = [key for key in cold_data if is_hot_key(key)]
+            self.cold.data = cold_data
+            self.hot.data = hot_data
+            self._loaded = True
+            if hot_keys:
+                # 设置文件已存在时以它为准, 旧文件中残留的设置直接丢弃
+                for key in hot_keys:
+                    value = cold_data.pop(key)
+                    if not hot_exists:
+                        hot_data[key] = value
+                if not hot_exists:
+                    self.hot.pending_keys.update(hot_keys)
+                    await self.hot.store.async_save(self.hot._data_to_save())
+                self.cold.schedule_save(*hot_keys)
+
+    def _file_for(self, key: str) -> StoreFile:
+        return self.hot if is_hot_key(key) else self.cold
+
+    async def _get(self, key: str):
+        await self.async_load()
+        return self._file_for(key).data.get(key, None)
+
+    async def _set(self, key: str, value: any):
+        await self.async_load()
+        file = self._file_for(key)
+        if key in file.data and file.data[key] == value:
+            return
+        file.data[key] = value
+        file.schedule_save(key)
+
+    async def async_flush(self):
+        """Save pending changes now"""
+        await self.hot.async_flush()
+        await self.cold.async_flush()
 
     async def async_get_api_key(self):
         """Get api key from store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        if stored_data:
-            return stored_data.get("api_key", None)
-        return None
-    
+        return await self._get("api_key")
+
     async def async_set_api_key(self, api_key: str):
         """Set api key to store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        stored_data["api_key"] = api_key
-        await self.store.async_save(stored_data)
-
-    async def async_get_devices(self):
-        """Get devices from store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        if stored_data:
-            return stored_data.get("devices", [])
-        return []
-    
-    async def async_set_devices(self, devices: list):
-        """Set devices to store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        stored_data["devices"] = devices
-        await self.store.async_save(stored_data)
+        await self._set("api_key", api_key)
+
+    async def async_get_devices_digest(self):
+        """Get devices digest from store"""
+        return await self._get("devices_digest")
+
+    async def async_set_devices_digest(self, digest: str, api_key: str):
+        """Set devices digest and the api key it was uploaded with to store"""
+        await self.async_load()
+        # 旧版本保存的完整设备列表不再需要
+        if self.cold.data.pop("devices", None) is not None:
+            self.cold.schedule_save("devices")
+        await self.async_set_values({"devices_digest": digest, "api_key": api_key})
 
     async def async_get_token(self, user_id: str):
         """Get token from store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        if stored_data:
-            return stored_data.get(user_id, None)
-        return None
+        return await self._get(user_id)
 
     async def async_set_token(self, user_id: str, token_id: str, access_token: str, expire_time: float):
         """Set token to store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        stored_data[user_id] = {
+        await self._set(user_id, {
             "token_id": token_id,
             "access_token": access_token,
             "expire_time": expire_time,
-        }
-        await self.store.async_save(stored_data)
+        })
 
     async def async_get_host(self):
         """Get host from store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        if stored_data:
-            return stored_data.get("host", None)
-        return None
-    
+        return await self._get("host")
+
     async def async_set_host(self, host: str):
         """Set host to store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        stored_data["host"] = host
-        await self.store.async_save(stored_data)
+        await self._set("host", host)
 
     async def async_set_key_value(self, key: str, value: any):
         """Set key value to store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        stored_data[key] = value
-        await self.store.async_save(stored_data)
+        await self._set(key, value)
 
     async def async_get_key_value(self, key: str):
         """Get key value from store"""
-        stored_data = await self.store.async_load()
-        if isinstance(stored_data, dict) == False:
-            stored_data = {}
-        if stored_data:
-            return stored_data.get(key, None)
-        return None
+        return await self._get(key)
+
+    async def async_get_values(self, keys: list[str]) -> dict:
+        """Get several values with one load"""
+        await self.async_load()
+        return {key: self._file_for(key).data.get(key, None) for key in keys}
+
+    async def async_set_values(self, values: dict):
+        """Set several values at once
+
+        所有修改在同一次事件循环中应用到内存并合并为一次保存, Store 以原子方式写文件,
+        因此断电后磁盘上要么是修改前、要么是修改后的完整状态。一组设置应属于同一个文件。
+        """
+        await self.async_load()
+        changed: dict[StoreFile, list[str]] = {}
+        for key, value in values.items():
+            file = self._file_for(key)
+            if key in file.data and file.data[key] == value:
+                continue
+            file.data[key] = value
+            changed.setdefault(file, []).append(key)
+        for file, keys in changed.items():
+            file.schedule_save(*keys)
+
+    def set_write_budget(self, budget_kib: int):
+        """设置每日写入预算(KiB), 0 表示不限制"""
+        self.stats.budget_bytes = int(budget_kib) * 1024
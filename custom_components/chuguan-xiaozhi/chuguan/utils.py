@@ -1,7 +1,7 @@
 import asyncio
 import psutil
 import logging
-from .model import SockResponse
+from .loader import loader_client
 import subprocess
 import aiohttp
 import async_timeout
@@ -37,25 +37,9 @@ def get_main_mac():
     return next(iter(macs.values())) if macs else None
 
 
-async def send_messages(message: str):
-    """Upload entities"""
-    writer = None
-    try:
-        reader, writer = await asyncio.open_unix_connection("/tmp/frpc_loader.sock")
-        writer.write(message.encode())
-        await writer.drain()   # 确保发送出去
-        writer.write_eof()     # 相当于 shutdown(SHUT_WR)
-        response = await reader.read(1024 * 1024)
-        res = response.decode()
-        _LOGGER.info(res)
-        obj = SockResponse.model_validate_json(res)
-        return obj
-    except Exception as e:
-        _LOGGER.error(f"write to /tmp/frpc_loader.sock error: {e}")
-    finally:
-        if writer is not None:
-            writer.close()
-            await writer.wait_closed()
+async def send_messages(data: dict):
+    """通过 frpc_loader 长连接发送消息"""
+    return await loader_client.request(data)
 
 
 def execute_shell(args: list[str]):
@@ -109,7 +93,14 @@ async def async_execute_shell(args: List[str]) -> Optional[str]:
 
         # 2. 等待命令执行完成，并获取输出
         # communicate() 会自动处理死锁问题，并返回 (stdout, stderr)
-        stdout, stderr = await proc.communicate()
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            # 调用方被取消时结束子进程, 避免留下孤儿进程
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
 
         # 3. 解码并返回结果
         # 如果命令执行失败（返回非0），可以根据需要记录日志，但不要抛出异常中断逻辑
@@ -24,6 +24,15 @@ async def met_weather_state_changed(hass: HomeAssistant, entity_id: str, new_sta
     await asyncio.sleep(30)
     await check_weather_state(hass, entity)
 
+def get_met_weather_entity_ids(hass: HomeAssistant) -> list[str]:
+    """All weather entities provided by met"""
+    entity_registry = async_get_entity_registry(hass)
+    return sorted(
+        entity.entity_id
+        for entity in entity_registry.entities.values()
+        if entity.platform == 'met' and entity.domain == 'weather'
+    )
+
 async def check_all_met_weather(hass: HomeAssistant):
     """Check all met weather entities"""
     entity_registry = async_get_entity_registry(hass)
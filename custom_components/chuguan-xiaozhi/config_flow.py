@@ -7,15 +7,16 @@ from typing import Any
 
 import voluptuous as vol
 
-from homeassistant.config_entries import ConfigFlow as ParentConfigFlow, ConfigFlowResult
+from homeassistant.config_entries import ConfigEntry, ConfigFlow as ParentConfigFlow, ConfigFlowResult, OptionsFlow
 from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.selector import SelectSelector, SelectSelectorConfig, SelectSelectorMode
+from homeassistant.core import HomeAssistant, callback
 
 import uuid
 import string
 import random
-from .chuguan.const import DOMAIN
+from .chuguan.const import DOMAIN, CONF_WRITE_BUDGET_KIB, DEFAULT_WRITE_BUDGET_KIB
+from .chuguan.const import CONF_RELAY_OPTIMISTIC, DEFAULT_RELAY_OPTIMISTIC, CONF_RADAR_STALL_SECONDS, DEFAULT_RADAR_STALL_SECONDS
+from .chuguan.const import CONF_DISTANCE_DEADBAND, DEFAULT_DISTANCE_DEADBAND, CONF_DISTANCE_MIN_INTERVAL, DEFAULT_DISTANCE_MIN_INTERVAL, CONF_DISTANCE_WINDOW, DEFAULT_DISTANCE_WINDOW
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -41,5 +42,41 @@ class ConfigFlow(ParentConfigFlow, domain=DOMAIN):
         self._abort_if_unique_id_configured()
         errors: dict[str, str] = {}
         return self.async_create_entry(title="Chuguan Xiaozhi", data={})
-        
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        """Create the options flow."""
+        return OptionsFlowHandler()
+
+
+# 串口后端(radar_backend/radar_serial_port/radar_serial_baudrate)需要实现了串口协议的固件, 暂不在表单中提供,
+# 已经保存在选项中的值在保存表单时保留
+OPTIONS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_WRITE_BUDGET_KIB, default=DEFAULT_WRITE_BUDGET_KIB): vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Optional(CONF_RELAY_OPTIMISTIC, default=DEFAULT_RELAY_OPTIMISTIC): bool,
+        vol.Optional(CONF_RADAR_STALL_SECONDS, default=DEFAULT_RADAR_STALL_SECONDS): vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Optional(f"motion_{CONF_DISTANCE_DEADBAND}", default=DEFAULT_DISTANCE_DEADBAND): vol.All(vol.Coerce(int), vol.Range(min=0, max=500)),
+        vol.Optional(f"motion_{CONF_DISTANCE_MIN_INTERVAL}", default=DEFAULT_DISTANCE_MIN_INTERVAL): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+        vol.Optional(f"motion_{CONF_DISTANCE_WINDOW}", default=DEFAULT_DISTANCE_WINDOW): vol.All(vol.Coerce(int), vol.Range(min=1, max=60)),
+        vol.Optional(f"presence_{CONF_DISTANCE_DEADBAND}", default=DEFAULT_DISTANCE_DEADBAND): vol.All(vol.Coerce(int), vol.Range(min=0, max=500)),
+        vol.Optional(f"presence_{CONF_DISTANCE_MIN_INTERVAL}", default=DEFAULT_DISTANCE_MIN_INTERVAL): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+        vol.Optional(f"presence_{CONF_DISTANCE_WINDOW}", default=DEFAULT_DISTANCE_WINDOW): vol.All(vol.Coerce(int), vol.Range(min=1, max=60)),
+    }
+)
+
+
+class OptionsFlowHandler(OptionsFlow):
+    """Handle options for chuguan_xiaozhi."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(data={**self.config_entry.options, **user_input})
+        return self.async_show_form(
+            step_id="init",
+            data_schema=self.add_suggested_values_to_schema(OPTIONS_SCHEMA, self.config_entry.options),
+        )
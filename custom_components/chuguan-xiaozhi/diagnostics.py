@@ -0,0 +1,14 @@
+"""Diagnostics support for the chuguan_xiaozhi integration."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    hub = entry.runtime_data
+    return hub.get_diagnostics()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# chuguan 是集成目录下的包, 不依赖 Home Assistant 的模块可以直接导入
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "chuguan-xiaozhi"))
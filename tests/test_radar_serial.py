@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from chuguan.radar_pty import FakeRadarBoard, format_status
+from chuguan.radar_serial import SerialCommandError, SerialRadarLink
+
+
+def run(scenario):
+    """在 pty 模拟扩展板上打开串口连接并运行 scenario(board, link, lines)"""
+    async def main():
+        board = FakeRadarBoard()
+        lines: list[str] = []
+        link = SerialRadarLink(board.open(), on_line=lines.append)
+        try:
+            await link.open()
+            return await scenario(board, link, lines)
+        finally:
+            link.close()
+            board.close()
+    return asyncio.run(main())
+
+
+async def wait_for_lines(lines: list[str], count: int):
+    async with asyncio.timeout(1):
+        while len(lines) < count:
+            await asyncio.sleep(0.01)
+
+
+def test_status_query():
+    async def scenario(board, link, lines):
+        board.status = (True, True, 120, None)
+        board.relays = [True, False, True]
+        return await link.command(["--status", "--query-relay"])
+
+    assert run(scenario) == format_status(True, True, 120, None) + "\n继电器 = 1 0 1"
+
+
+def test_relay_command():
+    async def scenario(board, link, lines):
+        reply = await link.command(["--relay", "1", "1"])
+        return reply, board.relays, board.commands
+
+    reply, relays, commands = run(scenario)
+    assert reply == "继电器 = 0 1 0"
+    assert relays == [False, True, False]
+    assert commands == [["--relay", "1", "1"]]
+
+
+def test_error_reply():
+    async def scenario(board, link, lines):
+        with pytest.raises(SerialCommandError, match="led expects 20 values"):
+            await link.command(["--led", "1", "2"])
+        # 出错后连接仍然可用
+        return await link.command(["--relay", "0", "1"])
+
+    assert run(scenario) == "继电器 = 1 0 0"
+
+
+def test_unsolicited_lines_are_not_part_of_reply():
+    async def scenario(board, link, lines):
+        board.hold_replies = True
+        command = asyncio.create_task(link.command(["--relay", "2", "1"]))
+        await asyncio.sleep(0.05)
+        board.report(False, True, None, 80)
+        board.release()
+        reply = await command
+        await wait_for_lines(lines, 1)
+        return reply, lines
+
+    reply, lines = run(scenario)
+    assert reply == "继电器 = 0 0 1"
+    assert lines == [format_status(False, True, None, 80)]
+
+
+def test_timeout_then_stale_reply_is_dropped():
+    async def scenario(board, link, lines):
+        board.hold_replies = True
+        with pytest.raises(TimeoutError):
+            await link.command(["--relay", "0", "1"], timeout=0.1)
+        # 超时命令的应答迟到, 序号与下一条命令不同
+        board.hold_replies = False
+        board.release()
+        reply = await link.command(["--status"])
+        return reply, lines
+
+    reply, lines = run(scenario)
+    assert reply == format_status(False, False, None, None)
+    assert lines == []
+
+
+def test_closed_link_rejects_commands():
+    async def scenario(board, link, lines):
+        link.close()
+        with pytest.raises(ConnectionError):
+            await link.command(["--status"])
+
+    run(scenario)